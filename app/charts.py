@@ -214,3 +214,47 @@ def scatter_distance_vs_travel_allowance(df: pd.DataFrame):
         },
     )
     return _style(fig)
+
+
+def bar_pay_percentiles(quantiles: pd.DataFrame, group_by: str = "department"):
+    percentiles = [c for c in quantiles.columns if c.startswith("p")]
+    data = quantiles.melt(
+        id_vars=[group_by], value_vars=percentiles,
+        var_name="percentile", value_name="amount",
+    )
+    fig = px.bar(
+        data,
+        x=group_by,
+        y="amount",
+        color="percentile",
+        barmode="group",
+        color_discrete_sequence=COLOR_PALETTE,
+        labels={
+            group_by: group_by.replace("_", " ").title(),
+            "amount": "Amount ($)",
+            "percentile": "Percentile",
+        },
+    )
+    return _style(fig)
+
+
+def bar_scenario_vs_baseline(deltas: pd.DataFrame, group_by: str = "department"):
+    data = deltas[deltas["component"] == "Total Pay"].melt(
+        id_vars=[group_by], value_vars=["baseline", "scenario"],
+        var_name="version", value_name="amount",
+    )
+    data["version"] = data["version"].str.title()
+    fig = px.bar(
+        data,
+        x=group_by,
+        y="amount",
+        color="version",
+        barmode="group",
+        color_discrete_sequence=COLOR_PALETTE,
+        labels={
+            group_by: group_by.replace("_", " ").title(),
+            "amount": "Total Pay ($)",
+            "version": "",
+        },
+    )
+    return _style(fig)
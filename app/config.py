@@ -11,6 +11,10 @@ SCHEMA: str = (os.getenv("SQL_SCHEMA") or "dbo").strip()
 
 FACT_TABLE: str = "Total_Pay_Fact"
 
+# pay quantile sketches built by the ETL; the accuracy must match its ETL_SKETCH_RELATIVE_ACCURACY
+SKETCH_TABLE: str = "Pay_Sketch_Fact"
+SKETCH_RELATIVE_ACCURACY: float = float(os.getenv("ETL_SKETCH_RELATIVE_ACCURACY") or 0.01)
+
 DIM_TABLES: dict[str, str] = {
     "staff": "Staff_dim",
     "date": "Date_dim",
@@ -1,22 +1,45 @@
 import charts
+import export
+import pandas as pd
+import scenarios
 import streamlit as st
 from config import MONTH_ORDER
-from data_loader import load_fact_joined
+from data_loader import (
+    from_date_key, load_date_bounds, load_dim, load_fact_joined, to_date_key,
+)
 
 st.title("Dashboard")
 
-df = load_fact_joined()
+bounds = load_date_bounds()
 
-if df.empty:
+if bounds is None:
     st.warning("No fact rows found.")
     st.stop()
 
 st.sidebar.header("Filters")
 
-months_present = [m for m in MONTH_ORDER if m in df["month_name"].unique()]
+first_day, last_day = from_date_key(bounds[0]), from_date_key(bounds[1])
+date_range = st.sidebar.date_input(
+    "Date range", value=(first_day, last_day),
+    min_value=first_day, max_value=last_day,
+)
+if len(date_range) != 2:
+    st.info("Select an end date to apply the date range.")
+    st.stop()
+
+df = load_fact_joined(to_date_key(date_range[0]), to_date_key(date_range[1]))
+
+if df.empty:
+    st.info("No records match the current filters.")
+    st.stop()
+
+months_present = [
+    m for i, m in enumerate(MONTH_ORDER, start=1) if i in df["month"].unique()
+]
 selected_months = st.sidebar.multiselect(
     "Month", months_present, default=months_present,
 )
+selected_month_numbers = [MONTH_ORDER.index(m) + 1 for m in selected_months]
 
 departments = sorted(df["department"].dropna().unique())
 selected_departments = st.sidebar.multiselect(
@@ -29,7 +52,7 @@ selected_staff = st.sidebar.multiselect(
 )
 
 filtered = df[
-    df["month_name"].isin(selected_months)
+    df["month"].isin(selected_month_numbers)
     & df["department"].isin(selected_departments)
     & df["staff_name"].isin(selected_staff)
 ]
@@ -38,6 +61,8 @@ if filtered.empty:
     st.info("No records match the current filters.")
     st.stop()
 
+export.export_controls(filtered, file_stem="dashboard")
+
 kpis = charts.kpi_metrics(filtered)
 c1, c2, c3, c4 = st.columns(4)
 c1.metric("Total Payments", f"${kpis.total_pay:,.2f}")
@@ -65,3 +90,78 @@ with right:
         charts.stacked_pay_composition(filtered, group_by="department"),
         use_container_width=True,
     )
+
+st.divider()
+st.subheader("What-if: Allowance Policies")
+st.caption(
+    "Edit the scenario rates to re-price the filtered jobs; "
+    "totals are compared with the pay currently on record."
+)
+
+travel_policy = load_dim("travel").rename(columns={
+    "TravelAllowancePolicy_id": "policy_id",
+    "vehicle type": "vehicle_type",
+    "travelallowanceRate": "rate",
+})[["policy_id", "vehicle_type", "rate"]]
+weather_policy = load_dim("weather").rename(columns={
+    "WeatherAllowancePolicy_id": "policy_id",
+    "weatehr allowance": "allowance",
+})[["policy_id", "weather", "temperature", "allowance"]]
+
+left, right = st.columns(2)
+with left:
+    travel_edit = st.data_editor(
+        travel_policy.assign(scenario_rate=travel_policy["rate"]),
+        disabled=["policy_id", "vehicle_type", "rate"],
+        hide_index=True,
+        use_container_width=True,
+        key="travel_scenario",
+    )
+with right:
+    weather_edit = st.data_editor(
+        weather_policy.assign(scenario_allowance=weather_policy["allowance"]),
+        disabled=["policy_id", "weather", "temperature", "allowance"],
+        hide_index=True,
+        use_container_width=True,
+        key="weather_scenario",
+    )
+
+scenario = scenarios.reprice(
+    filtered,
+    travel_edit.set_index("policy_id")["scenario_rate"],
+    weather_edit.set_index("policy_id")["scenario_allowance"],
+)
+
+overall = scenarios.scenario_deltas(filtered, scenario).set_index("component")
+for col, (component, row) in zip(st.columns(len(overall)), overall.iterrows()):
+    change = f"{row['delta']:+,.2f}"
+    if pd.notna(row["delta_pct"]):
+        change += f" ({row['delta_pct']:+.1%})"
+    col.metric(f"Scenario {component}", f"${row['scenario']:,.2f}", delta=change)
+
+compare_by = st.selectbox(
+    "Compare by", ["department", "vehicle_type", "weather", "work_type"],
+    format_func=lambda c: c.replace("_", " ").title(),
+)
+deltas = scenarios.scenario_deltas(filtered, scenario, by=compare_by)
+
+left, right = st.columns(2)
+with left:
+    st.plotly_chart(
+        charts.bar_scenario_vs_baseline(deltas, group_by=compare_by),
+        use_container_width=True,
+    )
+with right:
+    st.dataframe(
+        deltas,
+        hide_index=True,
+        use_container_width=True,
+        column_config={
+            compare_by: compare_by.replace("_", " ").title(),
+            "component": "Component",
+            "baseline": st.column_config.NumberColumn("Baseline ($)", format="%.2f"),
+            "scenario": st.column_config.NumberColumn("Scenario ($)", format="%.2f"),
+            "delta": st.column_config.NumberColumn("Delta ($)", format="%+.2f"),
+            "delta_pct": st.column_config.NumberColumn("Delta (%)", format="percent"),
+        },
+    )
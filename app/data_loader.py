@@ -1,15 +1,17 @@
 from __future__ import annotations
 
+from datetime import date
+
 import pandas as pd
 import streamlit as st
-from config import DIM_TABLES, FACT_TABLE, qualified
+from config import DIM_TABLES, FACT_TABLE, SKETCH_TABLE, qualified
 from db import get_connection
 
 
-def _query(sql: str):
+def _query(sql: str, params: tuple = ()):
     conn = get_connection()
     with conn.cursor() as cur:
-        cur.execute(sql)
+        cur.execute(sql, *params)
         columns = [desc[0] for desc in cur.description]
         rows = cur.fetchall()
     return pd.DataFrame.from_records(
@@ -17,8 +19,40 @@ def _query(sql: str):
     )
 
 
-@st.cache_data(ttl=600, show_spinner="Loading fact + dimensions from Azure SQL...")
-def load_fact_joined():
+def to_date_key(value: date):
+    return value.year * 10000 + value.month * 100 + value.day
+
+
+def from_date_key(key: int):
+    return date(key // 10000, key // 100 % 100, key % 100)
+
+
+@st.cache_data(ttl=600, show_spinner=False)
+def load_date_bounds():
+    df = _query(
+        f"SELECT MIN([Date_id]) AS lo, MAX([Date_id]) AS hi FROM {qualified(FACT_TABLE)}"
+    )
+    lo, hi = df.iloc[0]
+    if pd.isna(lo) or pd.isna(hi):
+        return None
+    return int(lo), int(hi)
+
+
+# fact rows of the date range joined with their dimensions; the query and the cache
+# work on whole calendar years, so the ranges sessions pick share a few cached entries
+# (at most one per span of years, and only the most recently used few) and the exact
+# range is filtered in memory
+def load_fact_joined(date_from: int | None = None, date_to: int | None = None):
+    if date_from is None or date_to is None:
+        return _load_fact_years()
+    df = _load_fact_years(date_from // 10000, date_to // 10000)
+    return df[df["date_key"].between(date_from, date_to)].reset_index(drop=True)
+
+
+@st.cache_data(
+    ttl=600, max_entries=4, show_spinner="Loading fact + dimensions from Azure SQL...",
+)
+def _load_fact_years(year_from: int | None = None, year_to: int | None = None):
     f = qualified(FACT_TABLE)
     s = qualified(DIM_TABLES["staff"])
     d = qualified(DIM_TABLES["date"])
@@ -34,11 +68,20 @@ def load_fact_joined():
         s.[Natural Key Staff ID] AS staff_natural_id,
         s.[Name] AS staff_name,
         s.[Email] AS staff_email,
-        d.[date] AS month_name,
+        f.[Date_id] AS date_key,
+        d.[date] AS date,
+        d.[year] AS year,
+        d.[quarter] AS quarter,
+        d.[month] AS month,
+        d.[month_name] AS month_name,
+        d.[week] AS week,
+        d.[day_name] AS day_name,
         dep.[Department] AS department,
         j.[work type] AS work_type,
+        f.[TravelAllowancePolicy_id] AS travel_policy_id,
         t.[vehicle type] AS vehicle_type,
         t.[travelallowanceRate] AS travel_allowance_rate,
+        f.[WeatherAllowancePolicy_id] AS weather_policy_id,
         w.[weather] AS weather,
         w.[temperature] AS temperature,
         w.[weatehr allowance] AS weather_allowance_rate,
@@ -60,7 +103,13 @@ def load_fact_joined():
     LEFT JOIN {h} h ON f.[Holiday_id] = h.[Holiday_id]
     """
 
-    df = _query(query)
+    # integer range predicate on the fact key so the engine can seek/prune
+    params: tuple = ()
+    if year_from is not None and year_to is not None:
+        query += "WHERE f.[Date_id] BETWEEN ? AND ?"
+        params = (year_from * 10000 + 101, year_to * 10000 + 1231)
+
+    df = _query(query, params)
 
     numeric_cols = [
         "work_hours", "travel_distance", "hourly_rate",
@@ -75,6 +124,39 @@ def load_fact_joined():
     return df
 
 
+@st.cache_data(ttl=600, show_spinner=False)
+def load_pay_sketches(month_from: int, month_to: int):
+    k = qualified(SKETCH_TABLE)
+    dep = qualified(DIM_TABLES["department"])
+    j = qualified(DIM_TABLES["job"])
+    t = qualified(DIM_TABLES["travel"])
+    w = qualified(DIM_TABLES["weather"])
+
+    # sketches are kept per yyyymm month, so only a month range can be pushed down
+    query = f"""
+    SELECT
+        k.[month_key] AS month_key,
+        dep.[Department] AS department,
+        j.[work type] AS work_type,
+        t.[vehicle type] AS vehicle_type,
+        w.[weather] AS weather,
+        k.[measure] AS measure,
+        k.[value] AS value,
+        k.[count] AS count
+    FROM {k} k
+    LEFT JOIN {dep} dep ON k.[Department_id] = dep.[Department_id]
+    LEFT JOIN {j} j ON k.[MaintenanceJob_id] = j.[MaintenanceJob_id]
+    LEFT JOIN {t} t ON k.[TravelAllowancePolicy_id] = t.[TravelAllowancePolicy_id]
+    LEFT JOIN {w} w ON k.[WeatherAllowancePolicy_id] = w.[WeatherAllowancePolicy_id]
+    WHERE k.[month_key] BETWEEN ? AND ?
+    """
+
+    df = _query(query, (month_from, month_to))
+    df["value"] = pd.to_numeric(df["value"], errors="coerce")
+    df["count"] = pd.to_numeric(df["count"], errors="coerce").astype("int64")
+    return df
+
+
 @st.cache_data(ttl=600, show_spinner=False)
 def load_dim(key: str):
     if key == "fact":
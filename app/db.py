@@ -1,9 +1,15 @@
 from __future__ import annotations
 
 import os
+import sqlite3
+import threading
 
-import pyodbc
 import streamlit as st
+from config import SCHEMA
+
+# SQLite file holding a local copy of the star schema (see loadtest.py); when set,
+# the app reads it instead of Azure SQL and needs no ODBC driver
+LOCAL_DB: str | None = os.getenv("APP_LOCAL_DB") or None
 
 
 def _build_conn_str():
@@ -43,6 +49,49 @@ def _build_conn_str():
     )
 
 
+class _LocalCursor:
+    def __init__(self, conn: LocalConnection):
+        self._conn = conn
+        self._cursor = conn._sqlite.cursor()
+
+    def __enter__(self):
+        # one connection serves every session, so statements run one at a time
+        self._conn._lock.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self._cursor.close()
+        self._conn._lock.release()
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    def execute(self, sql: str, *params):
+        self._cursor.execute(sql, params)
+        return self
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+
+class LocalConnection:
+    """pyodbc-style connection to LOCAL_DB, attached under SCHEMA so that
+    the ``[schema].[table]`` names used by data_loader resolve unchanged."""
+
+    def __init__(self, path: str):
+        self._sqlite = sqlite3.connect(":memory:", check_same_thread=False)
+        self._sqlite.execute("ATTACH DATABASE ? AS ?", (path, SCHEMA))
+        self._lock = threading.Lock()
+
+    def cursor(self):
+        return _LocalCursor(self)
+
+
 @st.cache_resource(show_spinner="Connecting to Azure SQL...")
 def get_connection():
+    if LOCAL_DB:
+        return LocalConnection(LOCAL_DB)
+
+    import pyodbc
     return pyodbc.connect(_build_conn_str())
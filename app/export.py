@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+import io
+import tempfile
+from collections.abc import Callable
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import streamlit as st
+
+EXPORT_FORMATS: dict[str, str] = {
+    "CSV": "text/csv",
+    "Parquet": "application/vnd.apache.parquet",
+}
+
+# rows formatted or converted to Arrow at a time
+EXPORT_BATCH_ROWS = 100_000
+
+
+def _batches(df: pd.DataFrame):
+    for start in range(0, max(len(df), 1), EXPORT_BATCH_ROWS):
+        yield start, df.iloc[start:start + EXPORT_BATCH_ROWS]
+
+
+def write_csv(df: pd.DataFrame, file):
+    for start, batch in _batches(df):
+        batch.to_csv(file, header=start == 0, index=False)
+
+
+def write_parquet(df: pd.DataFrame, file):
+    schema = pa.Schema.from_pandas(df, preserve_index=False)
+    with pq.ParquetWriter(file, schema, compression="zstd") as writer:
+        for _, batch in _batches(df):
+            writer.write_table(pa.Table.from_pandas(batch, schema=schema, preserve_index=False))
+
+
+# The file is only written when the download button is clicked, off the script run,
+# a batch of rows at a time into an unbuffered temporary file on disk (deleted once
+# the handle is dropped), so writing never holds more than one batch in memory.
+# Streamlit still reads the finished file into one bytes object and keeps it in its
+# in-memory media store for the session, so one copy of the exported file (not of
+# the frame) stays in memory per download.
+def _deferred(df: pd.DataFrame, fmt: str) -> Callable[[], io.RawIOBase]:
+    writer = write_csv if fmt == "CSV" else write_parquet
+
+    def export():
+        file = tempfile.TemporaryFile(buffering=0)
+        writer(df, file)
+        file.seek(0)
+        return file
+    return export
+
+
+def export_controls(filtered: pd.DataFrame, file_stem: str):
+    st.sidebar.header("Export")
+    fmt = st.sidebar.radio("Format", list(EXPORT_FORMATS), horizontal=True)
+
+    st.sidebar.download_button(
+        f"Download {len(filtered):,} rows as {fmt}",
+        data=_deferred(filtered, fmt),
+        file_name=f"{file_stem}.{fmt.lower()}",
+        mime=EXPORT_FORMATS[fmt],
+        on_click="ignore",
+        use_container_width=True,
+    )
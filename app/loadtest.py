@@ -0,0 +1,439 @@
+from __future__ import annotations
+
+# Concurrent-session load test for the Streamlit pages.
+#
+# Builds a synthetic star schema in a local SQLite file, points the app at it
+# (APP_LOCAL_DB, see db.py) and runs N headless sessions of the pages with
+# AppTest in this one process, so sessions share st.cache_data and the
+# db.get_connection resource the way they do on the server. Each session changes
+# a sidebar filter after an exponentially distributed think time, and the report
+# gives rerun latency percentiles, memory and the cache hit rate of each loader.
+#
+# AppTest is not thread-safe, so the script runs of all sessions are serialised
+# behind one lock: sessions still think and arrive concurrently and still share
+# the caches, so the hit rates and memory are those of concurrent users, but no
+# two reruns execute at once. The headline latency is end to end: the time a
+# rerun waited for the lock plus its script run. The wait stands in for contention
+# but is not the same as it: on the server reruns overlap and slow each other down
+# (GIL, connection, CPU) instead of queueing whole, so the wait share of that figure
+# is the harness's own. The script run alone is reported as uncontended latency,
+# the latency of a single user.
+# Interactions or reruns that raise are recorded as errors, and the report
+# compares the completed runs with the sessions x (interactions + 1) expected.
+#
+#   python loadtest.py --sessions 8 --interactions 20 --think 2 --rows 200000
+#   python loadtest.py --output before.json   # keep the report to compare runs
+
+import argparse
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+ETL_DIR = os.path.join(APP_DIR, "..", "etl")
+
+PAGES: list[str] = ["dashboard.py", "visualizations.py"]
+
+# sidebar filters a simulated user changes, besides the date range
+FILTER_LABELS: set[str] = {
+    "Month", "Department", "Staff", "Work type", "Vehicle", "Weather",
+}
+# main-area selectboxes a simulated user changes
+CHART_LABELS: set[str] = {"Measure", "Group by", "Compare by"}
+
+# serialises AppTest script runs across the session threads
+_RUN_LOCK = threading.Lock()
+
+CACHED_LOADERS: list[str] = [
+    "load_date_bounds", "load_fact_joined", "load_pay_sketches", "load_dim",
+]
+
+DEPARTMENTS = ["Electrical", "Plumbing", "Roads", "Parks", "Buildings"]
+WORK_TYPES = {"repair": 45, "inspection": 38, "installation": 52, "emergency": 70}
+VEHICLES = {"car": 0.8, "van": 1.1, "truck": 1.5, "bike": 0.3}
+WEATHERS = {
+    ("sunny", "hot"): 10, ("sunny", "mild"): 0, ("rain", "mild"): 15,
+    ("rain", "cold"): 20, ("snow", "cold"): 30,
+}
+
+
+def build_dataset(path: str, rows: int, staff: int, start: date, end: date, seed: int):
+    """Write a synthetic star schema with the ETL's table and column names."""
+    rng = np.random.default_rng(seed)
+
+    days = pd.date_range(start, end, freq="D")
+    iso = days.isocalendar()
+    date_dim = pd.DataFrame({
+        "date": days.strftime("%Y-%m-%d"),
+        "day": days.day,
+        "day_name": days.day_name(),
+        "day_of_week": days.dayofweek + 1,
+        "is_weekend": days.dayofweek >= 5,
+        "week": iso["week"].to_numpy(),
+        "week_year": iso["year"].to_numpy(),
+        "month": days.month,
+        "month_name": days.month_name(),
+        "quarter": days.quarter,
+        "year": days.year,
+        "Date_id": days.year * 10000 + days.month * 100 + days.day,
+    })
+
+    staff_dim = pd.DataFrame({
+        "Natural Key Staff ID": [f"S{i:04d}" for i in range(1, staff + 1)],
+        "Name": [f"Staff Member {i}" for i in range(1, staff + 1)],
+        "Email": [f"staff{i}@example.com" for i in range(1, staff + 1)],
+        "Staff_id": range(1, staff + 1),
+    })
+    department_dim = pd.DataFrame({
+        "Department": DEPARTMENTS, "Department_id": range(1, len(DEPARTMENTS) + 1),
+    })
+    job_dim = pd.DataFrame({
+        "work type": list(WORK_TYPES), "job hourly": list(WORK_TYPES.values()),
+        "MaintenanceJob_id": range(1, len(WORK_TYPES) + 1),
+    })
+    travel_dim = pd.DataFrame({
+        "vehicle type": list(VEHICLES), "travelallowanceRate": list(VEHICLES.values()),
+        "TravelAllowancePolicy_id": range(1, len(VEHICLES) + 1),
+    })
+    weather_dim = pd.DataFrame({
+        "weather": [w for w, _ in WEATHERS], "temperature": [t for _, t in WEATHERS],
+        "weatehr allowance": list(WEATHERS.values()),
+        "WeatherAllowancePolicy_id": range(1, len(WEATHERS) + 1),
+    })
+    holiday_dim = pd.DataFrame({"isholiday": [False, True], "Holiday_id": [1, 2]})
+
+    def pick(n: int):
+        return rng.integers(1, n + 1, rows)
+
+    fact = pd.DataFrame({
+        "Staff_id": pick(staff),
+        "Date_id": date_dim["Date_id"].to_numpy()[rng.integers(0, len(date_dim), rows)],
+        "Department_id": pick(len(DEPARTMENTS)),
+        "MaintenanceJob_id": pick(len(WORK_TYPES)),
+        "TravelAllowancePolicy_id": pick(len(VEHICLES)),
+        "WeatherAllowancePolicy_id": pick(len(WEATHERS)),
+        "Holiday_id": np.where(rng.random(rows) < 0.05, 2, 1),
+        "work hours": rng.integers(1, 9, rows),
+        "travel distance": rng.gamma(2.0, 12.0, rows).round(1),
+    })
+    fact["job hourly"] = job_dim["job hourly"].to_numpy()[fact["MaintenanceJob_id"] - 1]
+    fact["work payment"] = fact["work hours"] * fact["job hourly"]
+    fact["travel allowance amount"] = (
+        fact["travel distance"]
+        * travel_dim["travelallowanceRate"].to_numpy()[fact["TravelAllowancePolicy_id"] - 1]
+    )
+    fact["weather allowance amount"] = (
+        weather_dim["weatehr allowance"].to_numpy()[fact["WeatherAllowancePolicy_id"] - 1]
+    )
+    fact["total pay this job"] = (
+        fact["work payment"] + fact["travel allowance amount"] + fact["weather allowance amount"]
+    )
+    fact["Total_Pay_Fact_id"] = range(1, rows + 1)
+
+    # the sketches come from the ETL itself, so the page reads what a real run loads
+    sys.path.append(ETL_DIR)
+    from transform import build_pay_sketch
+    sketch = build_pay_sketch(fact)
+    sketch["Pay_Sketch_Fact_id"] = range(1, len(sketch) + 1)
+
+    from config import DIM_TABLES, FACT_TABLE, SKETCH_TABLE
+    tables = {
+        FACT_TABLE: fact,
+        SKETCH_TABLE: sketch,
+        DIM_TABLES["staff"]: staff_dim,
+        DIM_TABLES["date"]: date_dim,
+        DIM_TABLES["department"]: department_dim,
+        DIM_TABLES["job"]: job_dim,
+        DIM_TABLES["travel"]: travel_dim,
+        DIM_TABLES["weather"]: weather_dim,
+        DIM_TABLES["holiday"]: holiday_dim,
+    }
+
+    import sqlite3
+    with sqlite3.connect(path) as con:
+        for name, frame in tables.items():
+            frame.to_sql(name, con, index=False, if_exists="replace")
+        con.execute(f'CREATE INDEX "IX_{FACT_TABLE}_Date_id" ON "{FACT_TABLE}" ("Date_id")')
+        con.execute(f'CREATE INDEX "IX_{SKETCH_TABLE}_month_key" ON "{SKETCH_TABLE}" ("month_key")')
+
+
+class CacheCounter:
+    """Counts calls of the cached data_loader functions and the queries they run;
+    a call that runs no query was served from st.cache_data."""
+
+    def __init__(self, data_loader):
+        self.calls: dict[str, int] = defaultdict(int)
+        self.misses: dict[str, int] = defaultdict(int)
+        self.query_seconds: dict[str, float] = defaultdict(float)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+        # pages import the loaders on every rerun, so they pick up the wrappers
+        for name in CACHED_LOADERS:
+            setattr(data_loader, name, self._count_calls(name, getattr(data_loader, name)))
+        data_loader._query = self._count_queries(data_loader._query)
+
+    def _count_calls(self, name: str, loader):
+        def call(*args, **kwargs):
+            with self._lock:
+                self.calls[name] += 1
+            self._local.loader = name
+            try:
+                return loader(*args, **kwargs)
+            finally:
+                self._local.loader = None
+        return call
+
+    def _count_queries(self, query):
+        def call(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return query(*args, **kwargs)
+            finally:
+                name = getattr(self._local, "loader", None) or "other"
+                with self._lock:
+                    self.misses[name] += 1
+                    self.query_seconds[name] += time.perf_counter() - start
+        return call
+
+    def report(self):
+        return {
+            name: {
+                "calls": self.calls[name],
+                "misses": self.misses[name],
+                "hit_rate": round(1 - self.misses[name] / self.calls[name], 3),
+                "query_seconds": round(self.query_seconds[name], 3),
+            }
+            for name in CACHED_LOADERS if self.calls[name]
+        }
+
+
+def _interact(at, rng: random.Random):
+    """Change one filter the way a user would; returns the label changed, or
+    None when the page rendered no filter to change."""
+    widgets = [w for w in at.sidebar.multiselect if w.label in FILTER_LABELS and w.options]
+    widgets += [w for w in at.main.selectbox if w.label in CHART_LABELS and w.options]
+    dates = [w for w in at.sidebar.date_input if w.label == "Date range"]
+    if not widgets and not dates:
+        return None
+
+    choice = rng.randrange(len(widgets) + len(dates))
+    if choice >= len(widgets):
+        widget = dates[0]
+        span = (widget.max - widget.min).days
+        lo = rng.randrange(span + 1)
+        hi = rng.randrange(lo, span + 1)
+        widget.set_value((widget.min + timedelta(lo), widget.min + timedelta(hi)))
+        return "Date range"
+
+    widget = widgets[choice]
+    if widget.type == "selectbox":
+        widget.select_index(rng.randrange(len(widget.options)))
+    else:
+        widget.set_value(rng.sample(widget.options, rng.randint(1, len(widget.options))))
+    return widget.label
+
+
+def run_session(page: str, seed: int, args, results: list):
+    from streamlit.testing.v1 import AppTest
+
+    rng = random.Random(seed)
+    at = AppTest.from_file(os.path.join(APP_DIR, page), default_timeout=args.timeout)
+
+    def failed(action: str, error: str):
+        results.append({
+            "page": page, "action": action,
+            "seconds": np.nan, "run_seconds": np.nan, "wait_seconds": np.nan,
+            "error": True, "exception": error,
+        })
+
+    # one rerun, recorded as a row; returns whether the session can go on
+    def timed_run(action: str):
+        queued = time.perf_counter()
+        try:
+            with _RUN_LOCK:
+                start = time.perf_counter()
+                at.run()
+                end = time.perf_counter()
+        except Exception as e:
+            failed(action, f"{type(e).__name__}: {e}")
+            return False
+        results.append({
+            "page": page, "action": action,
+            # end to end, as the user sees it: queued for the lock, then run
+            "seconds": end - queued,
+            "run_seconds": end - start,
+            "wait_seconds": start - queued,
+            "error": bool(at.exception),
+            "exception": at.exception[0].message if at.exception else None,
+        })
+        return not at.exception
+
+    # stagger arrivals over one think time
+    time.sleep(rng.uniform(0, args.think))
+    if not timed_run("load"):
+        return at
+    for _ in range(args.interactions):
+        if args.think:
+            time.sleep(rng.expovariate(1 / args.think))
+        try:
+            with _RUN_LOCK:
+                action = _interact(at, rng)
+        except Exception as e:
+            failed("interact", f"{type(e).__name__}: {e}")
+            break
+        if action is None:
+            failed("interact", "no filter widgets rendered")
+            break
+        if not timed_run(action):
+            break
+    return at
+
+
+def _peak_rss():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _latency(seconds: pd.Series):
+    seconds = seconds.dropna()
+    return {
+        "runs": int(seconds.size),
+        "p50_ms": round(seconds.quantile(0.50) * 1000, 1),
+        "p95_ms": round(seconds.quantile(0.95) * 1000, 1),
+        "p99_ms": round(seconds.quantile(0.99) * 1000, 1),
+        "max_ms": round(seconds.max() * 1000, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Concurrent-session load test for the Streamlit pages.",
+    )
+    parser.add_argument("--sessions", type=int, default=8, help="concurrent sessions")
+    parser.add_argument("--interactions", type=int, default=10, help="filter changes per session")
+    parser.add_argument("--think", type=float, default=2.0, help="mean think time in seconds")
+    parser.add_argument("--pages", nargs="+", default=PAGES, choices=PAGES)
+    parser.add_argument("--rows", type=int, default=200_000, help="synthetic fact rows")
+    parser.add_argument("--staff", type=int, default=50)
+    parser.add_argument("--start", type=date.fromisoformat, default=date(2023, 1, 1))
+    parser.add_argument("--end", type=date.fromisoformat, default=date(2024, 12, 31))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=120, help="seconds allowed per rerun")
+    parser.add_argument("--db", help="SQLite file to reuse instead of building a new one")
+    parser.add_argument("--output", help="write the report as JSON to this file")
+    args = parser.parse_args()
+
+    sys.path.insert(0, APP_DIR)
+    path = args.db or os.path.join(tempfile.mkdtemp(prefix="loadtest-"), "star.sqlite")
+    if not (args.db and os.path.exists(args.db)):
+        print(f"Building {args.rows:,} synthetic fact rows in {path}")
+        build_dataset(path, args.rows, args.staff, args.start, args.end, args.seed)
+
+    # must be set before the app's db module is imported
+    os.environ["APP_LOCAL_DB"] = path
+    import data_loader
+    import streamlit as st
+    from streamlit.runtime.caching import cache_data_api
+
+    st.cache_data.clear()
+    counter = CacheCounter(data_loader)
+    baseline = _peak_rss()
+
+    print(f"Running {args.sessions} sessions x {args.interactions} interactions "
+          f"(think {args.think}s) on {', '.join(args.pages)}")
+    results: list[dict] = []
+    threads = [
+        threading.Thread(
+            target=run_session,
+            args=(args.pages[i % len(args.pages)], args.seed + i, args, results),
+        )
+        for i in range(args.sessions)
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    runs = pd.DataFrame(results)
+    expected = args.sessions * (args.interactions + 1)
+    completed = runs[~runs["error"]].assign(
+        kind=lambda r: np.where(r["action"] == "load", "load", "rerun"),
+    )
+
+    def latencies(column: str):
+        return {
+            "all": _latency(completed[column]),
+            **{
+                f"{page} {kind}": _latency(group[column])
+                for (page, kind), group in completed.groupby(["page", "kind"])
+            },
+        }
+
+    peak = _peak_rss()
+    cache_bytes = sum(
+        stat.byte_length
+        for stats in cache_data_api._data_caches.get_stats().values() for stat in stats
+    )
+    report = {
+        "sessions": args.sessions,
+        "interactions": args.interactions,
+        "think_seconds": args.think,
+        "rows": args.rows,
+        "elapsed_seconds": round(elapsed, 2),
+        "expected_runs": expected,
+        "completed_runs": len(completed),
+        "errors": int(runs["error"].sum()),
+        "error_counts": runs.loc[runs["error"], "exception"].value_counts().to_dict(),
+        "latency": latencies("seconds"),
+        "uncontended_latency": latencies("run_seconds"),
+        "wait": _latency(completed["wait_seconds"]),
+        "memory": {
+            "peak_rss_mb": round(peak / 2**20, 1),
+            "per_session_mb": round((peak - baseline) / 2**20 / args.sessions, 1),
+            "cache_data_mb": round(cache_bytes / 2**20, 1),
+        },
+        "cache": counter.report(),
+    }
+
+    print(f"\n{report['completed_runs']} of {report['expected_runs']} runs completed "
+          f"in {report['elapsed_seconds']}s, {report['errors']} with errors")
+    for error, count in report["error_counts"].items():
+        print(f"\t{count:>6}  {error}")
+    sections = [
+        ("latency (end to end)", report["latency"]),
+        ("uncontended (run only)", report["uncontended_latency"]),
+        ("wait for the run lock", {"all": report["wait"]}),
+    ]
+    for title, section in sections:
+        print(f"\n\t{title:<30} {'runs':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+        for name, l in section.items():
+            print(f"\t{name:<30} {l['runs']:>6} {l['p50_ms']:>9} {l['p95_ms']:>9} {l['p99_ms']:>9} {l['max_ms']:>9}")
+    m = report["memory"]
+    print(f"\n\tpeak RSS {m['peak_rss_mb']} MB, {m['per_session_mb']} MB per session, "
+          f"st.cache_data holds {m['cache_data_mb']} MB")
+    print(f"\n\t{'loader':<20} {'calls':>6} {'misses':>7} {'hit rate':>9} {'query s':>8}")
+    for name, c in report["cache"].items():
+        print(f"\t{name:<20} {c['calls']:>6} {c['misses']:>7} {c['hit_rate']:>9.1%} {c['query_seconds']:>8}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+
+# Policy what-if scenarios. The allowance amounts frozen into the fact table are
+# re-priced from edited copies of the policy dimensions: each policy table becomes
+# a lookup array indexed by its integer key, so re-pricing is one gather per
+# component over the fact rows' policy foreign keys.
+
+COMPONENTS: dict[str, str] = {
+    "travel_allowance_amount": "Travel Allowance",
+    "weather_allowance_amount": "Weather Allowance",
+    "total_pay": "Total Pay",
+}
+
+
+def _lookup(values: pd.Series):
+    table = np.full(int(values.index.max()) + 1, np.nan)
+    table[values.index.to_numpy(dtype="int64")] = values.to_numpy(dtype="float64")
+    return table
+
+
+# recompute the pay components of the fact rows in df; travel_rates and
+# weather_allowances hold the scenario value of every policy, indexed by its key
+def reprice(
+    df: pd.DataFrame, travel_rates: pd.Series, weather_allowances: pd.Series,
+):
+    travel_ids = df["travel_policy_id"].to_numpy(dtype="int64")
+    weather_ids = df["weather_policy_id"].to_numpy(dtype="int64")
+
+    travel = df["travel_distance"].to_numpy(dtype="float64") * _lookup(travel_rates)[travel_ids]
+    weather = _lookup(weather_allowances)[weather_ids]
+    total = df["work_payment"].to_numpy(dtype="float64") + travel + weather
+
+    return pd.DataFrame(
+        {
+            "travel_allowance_amount": travel,
+            "weather_allowance_amount": weather,
+            "total_pay": total,
+        },
+        index=df.index,
+    )
+
+
+# baseline and scenario totals of each component per `by` group (or overall),
+# with the absolute and relative change
+def scenario_deltas(df: pd.DataFrame, scenario: pd.DataFrame, by: str | None = None):
+    keys = df[by] if by else np.zeros(len(df), dtype="int8")
+    baseline = df[list(COMPONENTS)].groupby(keys).sum()
+    changed = scenario[list(COMPONENTS)].groupby(keys).sum()
+
+    out = (
+        pd.concat({"baseline": baseline.stack(), "scenario": changed.stack()}, axis=1)
+          .rename_axis([by or "group", "component"])
+          .reset_index()
+    )
+    out["delta"] = out["scenario"] - out["baseline"]
+    out["delta_pct"] = out["delta"] / out["baseline"].where(out["baseline"] != 0)
+    out["component"] = out["component"].map(COMPONENTS)
+    if not by:
+        out = out.drop(columns="group")
+    return out
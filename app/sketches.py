@@ -0,0 +1,38 @@
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+
+# Quantiles from the pay sketches loaded by load_pay_sketches. Each sketch row
+# counts the jobs whose measure falls in one log bucket, represented by a value
+# within the sketch's relative accuracy of every job in it, so sketch rows of
+# any months/groups merge by adding counts and keep the same error bound.
+
+
+def merge_sketches(sketch: pd.DataFrame, by: list[str] | None = None):
+    keys = (by or []) + ["measure", "value"]
+    return sketch.groupby(keys, as_index=False, dropna=False)["count"].sum()
+
+
+def _quantiles(group: pd.DataFrame, quantiles: list[float]):
+    group = group.sort_values("value")
+    cum = group["count"].cumsum().to_numpy()
+    values = group["value"].to_numpy()
+    # rank of the q-quantile among n values, as in numpy's "lower" interpolation
+    ranks = np.floor(np.asarray(quantiles) * (cum[-1] - 1))
+    positions = np.searchsorted(cum, ranks, side="right")
+    return pd.Series(values[positions], index=[f"p{round(q * 100)}" for q in quantiles])
+
+
+def sketch_quantiles(
+    sketch: pd.DataFrame, quantiles: list[float], by: list[str] | None = None,
+):
+    keys = (by or []) + ["measure"]
+    merged = merge_sketches(sketch, by)
+    if merged.empty:
+        return pd.DataFrame(columns=keys + [f"p{round(q * 100)}" for q in quantiles])
+    return (
+        merged.groupby(keys, dropna=False)[["value", "count"]]
+              .apply(_quantiles, quantiles=quantiles)
+              .reset_index()
+    )
@@ -1,22 +1,45 @@
 import charts
+import export
+import sketches
 import streamlit as st
-from config import MONTH_ORDER
-from data_loader import load_fact_joined
+from config import MONTH_ORDER, SKETCH_RELATIVE_ACCURACY
+from data_loader import (
+    from_date_key, load_date_bounds, load_fact_joined, load_pay_sketches,
+    to_date_key,
+)
 
 st.title("Visualizations")
 
-df = load_fact_joined()
+bounds = load_date_bounds()
 
-if df.empty:
+if bounds is None:
     st.warning("No fact rows found.")
     st.stop()
 
 st.sidebar.header("Filters")
 
-months_present = [m for m in MONTH_ORDER if m in df["month_name"].unique()]
+first_day, last_day = from_date_key(bounds[0]), from_date_key(bounds[1])
+date_range = st.sidebar.date_input(
+    "Date range", value=(first_day, last_day),
+    min_value=first_day, max_value=last_day,
+)
+if len(date_range) != 2:
+    st.info("Select an end date to apply the date range.")
+    st.stop()
+
+df = load_fact_joined(to_date_key(date_range[0]), to_date_key(date_range[1]))
+
+if df.empty:
+    st.info("No records match the current filters.")
+    st.stop()
+
+months_present = [
+    m for i, m in enumerate(MONTH_ORDER, start=1) if i in df["month"].unique()
+]
 selected_months = st.sidebar.multiselect(
     "Month", months_present, default=months_present,
 )
+selected_month_numbers = [MONTH_ORDER.index(m) + 1 for m in selected_months]
 
 work_types = sorted(df["work_type"].dropna().unique())
 selected_work_types = st.sidebar.multiselect(
@@ -34,7 +57,7 @@ selected_weather = st.sidebar.multiselect(
 )
 
 filtered = df[
-    df["month_name"].isin(selected_months)
+    df["month"].isin(selected_month_numbers)
     & df["work_type"].isin(selected_work_types)
     & df["vehicle_type"].isin(selected_vehicles)
     & df["weather"].isin(selected_weather)
@@ -44,6 +67,8 @@ if filtered.empty:
     st.info("No records match the current filters.")
     st.stop()
 
+export.export_controls(filtered, file_stem="visualizations")
+
 left, right = st.columns(2)
 with left:
     st.subheader("Pay Share by Job Type")
@@ -70,3 +95,40 @@ st.subheader("Travel Distance vs Travel Allowance")
 st.plotly_chart(
     charts.scatter_distance_vs_travel_allowance(filtered), use_container_width=True,
 )
+
+st.divider()
+st.subheader("Pay Percentiles")
+
+# sketches are per month, so the date range is widened to whole months here
+sketch = load_pay_sketches(
+    to_date_key(date_range[0]) // 100, to_date_key(date_range[1]) // 100,
+)
+sketch = sketch[
+    (sketch["month_key"] % 100).isin(selected_month_numbers)
+    & sketch["work_type"].isin(selected_work_types)
+    & sketch["vehicle_type"].isin(selected_vehicles)
+    & sketch["weather"].isin(selected_weather)
+]
+
+left, right = st.columns(2)
+with left:
+    measure = st.selectbox("Measure", sorted(sketch["measure"].unique()) or ["total pay this job"])
+with right:
+    group_by = st.selectbox(
+        "Group by", ["department", "work_type", "vehicle_type", "weather"],
+        format_func=lambda c: c.replace("_", " ").title(),
+    )
+
+quantiles = sketches.sketch_quantiles(
+    sketch[sketch["measure"] == measure], [0.5, 0.9, 0.99], by=[group_by],
+)
+if quantiles.empty:
+    st.info("No pay sketches match the current filters.")
+else:
+    st.plotly_chart(
+        charts.bar_pay_percentiles(quantiles, group_by), use_container_width=True,
+    )
+    st.caption(
+        f"Percentiles are read from mergeable sketches and are within "
+        f"\u00b1{SKETCH_RELATIVE_ACCURACY:.0%} of the exact value, over whole months."
+    )
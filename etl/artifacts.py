@@ -0,0 +1,156 @@
+import gzip
+import hashlib
+import io
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+from azure.core.exceptions import ResourceExistsError, ResourceNotFoundError
+
+# where and how run outputs are archived in Azure Storage
+ARTIFACT_CONTAINER = os.environ.get('ARTIFACT_CONTAINER') or 'etl-artifacts'
+ARTIFACT_PREFIX = os.environ.get('ARTIFACT_PREFIX') or ''
+ARTIFACT_COMPRESSION = (os.environ.get('ARTIFACT_COMPRESSION') or 'gzip').strip().lower()
+
+# files uploaded at once, parallel block uploads per file, and block size in bytes
+ARTIFACT_WORKERS = int(os.environ.get('ARTIFACT_WORKERS') or 4)
+ARTIFACT_MAX_CONCURRENCY = int(os.environ.get('ARTIFACT_MAX_CONCURRENCY') or 4)
+ARTIFACT_BLOCK_SIZE = int(os.environ.get('ARTIFACT_BLOCK_SIZE') or 4 * 1024 * 1024)
+
+EXTENSIONS = {'gzip': '.gz', 'zstd': '.zst', 'none': ''}
+
+# BlobServiceClient options applying ARTIFACT_BLOCK_SIZE to block uploads
+def artifact_blob_options():
+    return {'max_block_size': ARTIFACT_BLOCK_SIZE, 'max_single_put_size': ARTIFACT_BLOCK_SIZE}
+
+
+# binary sink that hashes the uncompressed content on its way to the compressor
+class _HashingWriter(io.RawIOBase):
+    def __init__(self, sink):
+        self.sink = sink
+        self.digest = hashlib.sha256()
+        self.size = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.digest.update(data)
+        self.size += len(data)
+        self.sink.write(data)
+        return len(data)
+
+
+# Uploads a batch of run outputs concurrently. Each artifact is rendered straight
+# into an in-memory (optionally compressed) buffer, hashed on the way, and skipped
+# when the blob already holds content with the same hash.
+# `container` is a ContainerClient or anything with the same get_blob_client API,
+# such as LocalBlobContainer.
+class ArtifactPublisher():
+    def __init__(self, container, prefix=ARTIFACT_PREFIX, compression=ARTIFACT_COMPRESSION,
+                 workers=ARTIFACT_WORKERS, max_concurrency=ARTIFACT_MAX_CONCURRENCY):
+        if compression not in EXTENSIONS:
+            raise ValueError(f"Unknown compression '{compression}', use one of {list(EXTENSIONS)}")
+        self.container = container
+        self.prefix = prefix
+        self.compression = compression
+        self.workers = workers
+        self.max_concurrency = max_concurrency
+        self.artifacts = {}
+
+    # queue a DataFrame, written as csv the same way as the ./data outputs
+    def add_frame(self, name, frame):
+        self.artifacts[name] = lambda out: frame.to_csv(out)
+
+    # queue a local file
+    def add_file(self, path, name=None):
+        def write(out):
+            with open(path, 'rb') as f:
+                for block in iter(lambda: f.read(1 << 20), b''):
+                    out.write(block)
+        self.artifacts[name or os.path.basename(path)] = write
+
+    # queue in-memory content
+    def add_bytes(self, name, data):
+        self.artifacts[name] = lambda out: out.write(data)
+
+    def _compressor(self, buffer):
+        if self.compression == 'gzip':
+            return gzip.GzipFile(fileobj=buffer, mode='wb', mtime=0)
+        if self.compression == 'zstd':
+            import zstandard
+            return zstandard.ZstdCompressor().stream_writer(buffer, closefd=False)
+        return None
+
+    # render an artifact into a buffer, returning it with the hash and size of the raw content
+    def _render(self, write):
+        buffer = io.BytesIO()
+        compressor = self._compressor(buffer)
+        out = _HashingWriter(compressor or buffer)
+        write(out)
+        if compressor is not None:
+            compressor.close()
+        buffer.seek(0)
+        return buffer, out.digest.hexdigest(), out.size
+
+    def _upload(self, name, write):
+        blob_name = self.prefix + name + EXTENSIONS[self.compression]
+        buffer, digest, size = self._render(write)
+        blob_client = self.container.get_blob_client(blob_name)
+        try:
+            if blob_client.get_blob_properties().metadata.get('content_sha256') == digest:
+                return {'blob': blob_name, 'status': 'unchanged', 'bytes': size, 'uploaded_bytes': 0}
+        except ResourceNotFoundError:
+            pass
+
+        uploaded = buffer.getbuffer().nbytes
+        blob_client.upload_blob(
+            buffer, length=uploaded, overwrite=True, max_concurrency=self.max_concurrency,
+            metadata={'content_sha256': digest, 'compression': self.compression},
+        )
+        return {'blob': blob_name, 'status': 'uploaded', 'bytes': size, 'uploaded_bytes': uploaded}
+
+    # upload every queued artifact and return one metrics record per artifact
+    def publish(self):
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = [pool.submit(self._upload, name, write) for name, write in self.artifacts.items()]
+            results = [future.result() for future in futures]
+        self.artifacts = {}
+        return results
+
+
+def print_artifact_metrics(results):
+    for r in results:
+        print(f"\t{r['status']:<10} {r['blob']:<45} {r['bytes']:>12,} B -> {r['uploaded_bytes']:>12,} B")
+
+
+# Filesystem-backed stand-in for a ContainerClient: blobs are files under `root`
+# and their metadata is kept in a `<blob>.metadata.json` file next to them.
+class LocalBlobContainer():
+    def __init__(self, root):
+        self.root = root
+
+    def get_blob_client(self, blob):
+        return LocalBlobClient(os.path.join(self.root, blob))
+
+class LocalBlobClient():
+    def __init__(self, path):
+        self.path = path
+        self.metadata_path = path + '.metadata.json'
+
+    def upload_blob(self, data, length=None, overwrite=False, metadata=None, **kwargs):
+        if os.path.exists(self.path) and not overwrite:
+            raise ResourceExistsError(f'Blob {self.path} already exists')
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with open(self.path, 'wb') as f:
+            for block in iter(lambda: data.read(1 << 20), b''):
+                f.write(block)
+        with open(self.metadata_path, 'w') as f:
+            json.dump(metadata or {}, f)
+
+    def get_blob_properties(self):
+        if not os.path.exists(self.path):
+            raise ResourceNotFoundError(f'Blob {self.path} not found')
+        with open(self.metadata_path) as f:
+            return SimpleNamespace(metadata=json.load(f), size=os.path.getsize(self.path))
@@ -0,0 +1,136 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+
+import pandas as pd
+from sqlalchemy import exc
+
+# where stage checkpoints and the run manifest are kept
+CHECKPOINT_DIR = os.environ.get('ETL_CHECKPOINT_DIR') or './checkpoints'
+
+# retry policy for transient database errors
+RETRY_ATTEMPTS = int(os.environ.get('ETL_RETRY_ATTEMPTS') or 5)
+RETRY_BACKOFF = float(os.environ.get('ETL_RETRY_BACKOFF') or 2)
+RETRY_BACKOFF_MAX = float(os.environ.get('ETL_RETRY_BACKOFF_MAX') or 60)
+
+# SQLSTATEs and SQL Server / Azure SQL error numbers worth retrying
+# (connection loss, timeouts, deadlocks, throttling, database failover)
+TRANSIENT_SQLSTATES = ['08S01', '08001', '08003', '08004', '08007', 'HYT00', 'HYT01', '40001']
+TRANSIENT_ERROR_CODES = ['1205', '4060', '10928', '10929', '40197', '40501', '40613', '49918', '49919', '49920']
+
+
+# sha256 of a file, read in blocks
+def file_checksum(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# Run manifest: records every completed stage of a run, so a rerun against the
+# same source can skip it. Stages with data are written as Parquet files and are
+# only trusted while their checksum still matches the one recorded.
+class RunManifest():
+    def __init__(self, source_id, directory=CHECKPOINT_DIR):
+        self.directory = directory
+        self.path = os.path.join(directory, 'manifest.json')
+        os.makedirs(directory, exist_ok=True)
+
+        self.manifest = {}
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                self.manifest = json.load(f)
+
+        if self.manifest.get('source_id') != source_id:
+            if self.manifest:
+                print('Source changed since the last run, discarding checkpoints')
+            self.reset(source_id)
+        elif self.manifest['stages']:
+            print(f"Resuming run started {self.manifest['started']} ({len(self.manifest['stages'])} stages done)")
+
+    def _write(self):
+        # write then rename, so a crash never leaves a truncated manifest
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.manifest, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    # start a new run for the given source
+    def reset(self, source_id):
+        self.clear()
+        self.manifest = {
+            'source_id': source_id,
+            'started': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'stages': {},
+        }
+        self._write()
+
+    # remove every checkpoint, e.g. once the run has been published
+    def clear(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+        os.makedirs(self.directory, exist_ok=True)
+
+    # True if the stage completed and its checkpoint (if any) is intact
+    def done(self, stage):
+        entry = self.manifest['stages'].get(stage)
+        if entry is None:
+            return False
+        if 'file' in entry:
+            path = os.path.join(self.directory, entry['file'])
+            if not os.path.exists(path) or file_checksum(path) != entry['checksum']:
+                print(f'Checkpoint for {stage} is stale, redoing it')
+                del self.manifest['stages'][stage]
+                self._write()
+                return False
+        return True
+
+    def info(self, stage):
+        return self.manifest['stages'][stage]
+
+    # record a completed stage
+    def mark(self, stage, **info):
+        info['completed'] = time.strftime('%Y-%m-%d %H:%M:%S')
+        self.manifest['stages'][stage] = info
+        self._write()
+
+    # checkpoint a stage's DataFrame as Parquet and record it as completed
+    def save_frame(self, stage, frame, row_group_size=None, **info):
+        file_name = f'{stage}.parquet'
+        path = os.path.join(self.directory, file_name)
+        frame.to_parquet(path, index=False, row_group_size=row_group_size)
+        self.mark(stage, file=file_name, checksum=file_checksum(path), rows=len(frame), **info)
+
+    def frame_path(self, stage):
+        return os.path.join(self.directory, self.info(stage)['file'])
+
+    def load_frame(self, stage):
+        return pd.read_parquet(self.frame_path(stage))
+
+
+# True for database errors that are likely to succeed when retried
+def is_transient(error):
+    if isinstance(error, exc.DBAPIError) and error.connection_invalidated:
+        return True
+    message = str(getattr(error, 'orig', error))
+    return (
+        any(f'[{state}]' in message or f"'{state}'" in message for state in TRANSIENT_SQLSTATES)
+        or any(f'({code})' in message for code in TRANSIENT_ERROR_CODES)
+    )
+
+
+# call action, retrying transient database errors with exponential backoff
+def with_retry(action, *args, **kwargs):
+    delay = RETRY_BACKOFF
+    for attempt in range(1, RETRY_ATTEMPTS + 1):
+        try:
+            return action(*args, **kwargs)
+        except Exception as e:
+            if attempt == RETRY_ATTEMPTS or not is_transient(e):
+                raise
+            print(f'Transient database error ({e.__class__.__name__}), '
+                  f'retrying in {delay:.0f}s [{attempt}/{RETRY_ATTEMPTS - 1}]')
+            time.sleep(delay)
+            delay = min(delay * 2, RETRY_BACKOFF_MAX)
@@ -22,9 +22,13 @@ connect_str = os.getenv('AZURE_STORAGE_CONNECTION_STRING')
 # set up schema
 TARGET_SCHEMA = (os.environ.get('SQL_SCHEMA') or 'dbo').strip()
 
+# schemas holding the next version while it loads and the previous version after a swap
+STAGE_SCHEMA = (os.environ.get('SQL_STAGE_SCHEMA') or f'{TARGET_SCHEMA}_stage').strip()
+BACKUP_SCHEMA = (os.environ.get('SQL_BACKUP_SCHEMA') or f'{TARGET_SCHEMA}_backup').strip()
+
 # format table name
-def sql_table(quoted_name: str) -> str:
-    return f'[{TARGET_SCHEMA}].[{quoted_name}]'
+def sql_table(quoted_name: str, schema: str = TARGET_SCHEMA) -> str:
+    return f'[{schema}].[{quoted_name}]'
 
 # build ODBC connection string
 def _azure_sql_odbc_connect() -> str:
@@ -52,11 +56,12 @@ def _azure_sql_odbc_connect() -> str:
 engine = create_engine("mssql+pyodbc:///?odbc_connect=" + _azure_sql_odbc_connect())
 
 class AzureDB():
-    def __init__(self, local_path = "./data", account_storage = account_storage):
+    # blob_options are passed to BlobServiceClient, e.g. max_block_size for block uploads
+    def __init__(self, local_path = "./data", account_storage = account_storage, blob_options = None):
         self.local_path = local_path
         self.account_url = f"https://{account_storage}.blob.core.windows.net"
         self.default_credential = DefaultAzureCredential()
-        self.blob_service_client = BlobServiceClient.from_connection_string(connect_str)
+        self.blob_service_client = BlobServiceClient.from_connection_string(connect_str, **(blob_options or {}))
 
     # access a specific container or create if not exist
     def access_container(self, container_name):
@@ -87,7 +92,8 @@ class AzureDB():
         print("\nUploading to Azure Storage as blob:\n\t" + local_file_name)
 
         if blob_data is not None:
-            blob_client.create_blob_from_text(container_name=self.container_name, blob_name=blob_name, text=blob_data)
+            # upload str/bytes/stream content straight from memory
+            blob_client.upload_blob(blob_data, overwrite=True)
         else:
             # upload the file
             with open(file=upload_file_path, mode="rb") as data:
@@ -113,22 +119,27 @@ class AzureDB():
         blob_client = self.blob_service_client.get_blob_client(container=container_name, blob=blob_name)
         blob_client.delete_blob()
 
-    # read a csv blob from Azure Storage and return as DataFrame
-    def access_blob_csv(self, blob_name):
+    # ETag of a blob, changes whenever the blob content is replaced
+    def blob_etag(self, blob_name):
+        return self.container_client.get_blob_client(blob_name).get_blob_properties().etag
+
+    # read a csv blob from Azure Storage and return as DataFrame, applying the dtype plan at parse time
+    def access_blob_csv(self, blob_name, dtype=None):
         try:
             print(f"Acessing blob {blob_name}")
-            df = pd.read_csv(io.StringIO(self.container_client.download_blob(blob_name).readall().decode('utf-8')))
+            df = pd.read_csv(io.BytesIO(self.container_client.download_blob(blob_name).readall()), dtype=dtype)
             return df
         except Exception as ex:
             print('Exception:')
             print(ex)
+            raise
 
     # upload a DataFrame to Azure SQL Database as a table
-    def upload_dataframe_sqldatabase(self, blob_name, blob_data):
-        print("\nUploading to Azure SQL server as table:\n\t" + blob_name)
-        blob_data.to_sql(blob_name, engine, schema=TARGET_SCHEMA, if_exists='replace', index=False)
+    def upload_dataframe_sqldatabase(self, blob_name, blob_data, schema=TARGET_SCHEMA):
+        print(f"\nUploading to Azure SQL server as table:\n\t{schema}.{blob_name}")
+        blob_data.to_sql(blob_name, engine, schema=schema, if_exists='replace', index=False)
         primary = blob_name.replace('dim', 'id')
-        qt = sql_table(blob_name)
+        qt = sql_table(blob_name, schema)
         if 'fact' in blob_name.lower():
             with engine.connect() as con:
                 trans = con.begin()
@@ -143,9 +154,9 @@ class AzureDB():
                 trans.commit()
 
     # append a DataFrame to an existing table in Azure SQL Database
-    def append_dataframe_sqldatabase(self, blob_name, blob_data):
-        print("\nAppending to table:\n\t" + blob_name)
-        blob_data.to_sql(blob_name, engine, schema=TARGET_SCHEMA, if_exists='append', index=False)
+    def append_dataframe_sqldatabase(self, blob_name, blob_data, schema=TARGET_SCHEMA):
+        print(f"\nAppending to table:\n\t{schema}.{blob_name}")
+        blob_data.to_sql(blob_name, engine, schema=schema, if_exists='append', index=False)
 
     # delete a table from Azure SQL Database
     def delete_sqldatabase(self, table_name):
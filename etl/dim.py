@@ -1,23 +1,67 @@
+import numpy as np
+
 from db import *
+from transform import date_key, row_codes
 
 # raw file's blob name in Azure Storage
 blob_name = "ETL_Example_Data.csv"
 
-# intialize AzureDB
-database = AzureDB()
+# dtype plan applied while parsing the source csv
+#   text repeats per job (staff details, dates, policies) -> category, whose values are
+#   Arrow-backed strings; counts downcast to the smallest nullable int that fits, so a blank
+#   cell reads as <NA> instead of failing the read (a blank staff ID is keyed like any other
+#   value, a blank measure is quarantined); money rates stay float64 so allowance amounts
+#   keep exact cents; work hours are read as category too and parsed per distinct value,
+#   so a malformed value is quarantined instead of failing the read
+SOURCE_DTYPES = {
+    'Natural Key Staff ID': 'Int32',
+    'Name': 'category',
+    'Contact Phone': 'category',
+    'Home Address': 'category',
+    'Email': 'category',
+    'Department': 'category',
+    'date': 'category',
+    'work hours': 'category',
+    'work type': 'category',
+    'travel distance': 'Int32',
+    'vehicle type': 'category',
+    'weather': 'category',
+    'temperature': 'category',
+    'isholiday': 'category',
+    'job hourly': 'Int16',
+    'work payment $': 'Int32',
+    'travelallowanceRate': 'float64',
+    'weatehr allowance': 'Int16',
+}
+
+# AzureDB with the container holding the csv file, created on first use rather than
+# at import: under the spawn/forkserver start methods every transform worker re-imports
+# main.py and with it this module
+_database = None
+
+def get_database():
+    global _database
+    if _database is None:
+        # intialize AzureDB
+        _database = AzureDB()
 
-# access the container and read the csv file
-database.access_container("test")
-df = database.access_blob_csv(blob_name=blob_name)
+        # access the container holding the csv file
+        _database.access_container("test")
+    return _database
+
+# read the raw csv file with the dtype plan applied
+def read_source(csv_file=blob_name):
+    return get_database().access_blob_csv(blob_name=csv_file, dtype=SOURCE_DTYPES)
 
 class ModelAbstract():
     def __init__(self):
         self.columns = None
         self.dimension_table = None
 
-    def dimension_generator(self, name:str, columns:list):
-        dim = df[columns]
-        dim = dim.drop_duplicates()
+    def dimension_generator(self, name:str, columns:list, source):
+        # first occurrence of each distinct row, in source order (as drop_duplicates would)
+        _, first = np.unique(row_codes(source, columns), return_index=True)
+        dim = source[columns].take(np.sort(first))
 
         # create primary key
         dim[f'{name}_id'] = range(1, len(dim) + 1)
@@ -26,10 +70,20 @@ class ModelAbstract():
         self.name = name
         self.columns = columns
 
-    def load(self):
+    # restore a dimension table generated by an earlier run (e.g. from a checkpoint)
+    def restore(self, name:str, columns:list, dimension_table):
+        self.dimension_table = dimension_table
+        self.name = name
+        self.columns = columns
+
+    # (name, natural key columns, table) used to key fact rows, see transform.transform_rows
+    def key_map(self):
+        return self.name, self.columns, self.dimension_table
+
+    def load(self, schema=TARGET_SCHEMA):
         if self.dimension_table is not None:
             # upload dimension table to data warehouse
-            database.upload_dataframe_sqldatabase(f'{self.name}_dim', blob_data=self.dimension_table)
+            get_database().upload_dataframe_sqldatabase(f'{self.name}_dim', blob_data=self.dimension_table, schema=schema)
 
             # save dimension table as separate file
             self.dimension_table.to_csv(f'./data/{self.name}_dim.csv')
@@ -38,36 +92,75 @@ class ModelAbstract():
 
 # staff dimension table
 class DimStaff(ModelAbstract):
-    def __init__(self):
+    def __init__(self, source):
         super().__init__()
-        self.dimension_generator('Staff', ['Natural Key Staff ID', 'Name', 'Contact Phone', 'Home Address', "Email"])
+        self.dimension_generator('Staff', ['Natural Key Staff ID', 'Name', 'Contact Phone', 'Home Address', "Email"], source)
 
 # date dimension table
 class DimDate(ModelAbstract):
-    def __init__(self):
+    def __init__(self, dates):
         super().__init__()
-        self.dimension_generator('Date', ['date'])
+        self.calendar_generator(dates)
+
+    # generate one row per calendar day, covering whole years of the source date range;
+    # if no date parsed the calendar is empty and the quality gate stops the run
+    def calendar_generator(self, dates):
+        first, last = dates.min(), dates.max()
+        if pd.isna(first):
+            days = pd.Series([], dtype='datetime64[ns]')
+        else:
+            days = pd.Series(pd.date_range(f'{first.year}-01-01', f'{last.year}-12-31', freq='D'))
+        iso = days.dt.isocalendar()
+
+        calendar = pd.DataFrame({
+            'date': days,
+            'day': days.dt.day.astype('int8'),
+            'day_name': days.dt.day_name(),
+            'day_of_week': (days.dt.dayofweek + 1).astype('int8'),
+            'is_weekend': days.dt.dayofweek >= 5,
+            'week': iso['week'].astype('int8'),
+            'week_year': iso['year'].astype('int16'),
+            'month': days.dt.month.astype('int8'),
+            'month_name': days.dt.month_name(),
+            'quarter': days.dt.quarter.astype('int8'),
+            'year': days.dt.year.astype('int16'),
+        })
+        calendar['Date_id'] = date_key(days)
+
+        self.dimension_table = calendar
+        self.name = 'Date'
+        self.columns = ['date']
+
+    # the key is derived from the date itself, so no lookup table is needed
+    def key_map(self):
+        return self.name, self.columns, None
 
 # holiday dimension table
 class DimDepartment(ModelAbstract):
-    def __init__(self):
+    def __init__(self, source):
         super().__init__()
-        self.dimension_generator('Department', ['Department'])
+        self.dimension_generator('Department', ['Department'], source)
 
 # maintenance job dimension table
 class DimMaintenanceJob(ModelAbstract):
-    def __init__(self):
+    def __init__(self, source):
         super().__init__()
-        self.dimension_generator('MaintenanceJob', ['work type'])
+        self.dimension_generator('MaintenanceJob', ['work type'], source)
 
 # travel allowance policy dimension table
 class DimTravelAllowancePolicy(ModelAbstract):
-    def __init__(self):
+    def __init__(self, source):
         super().__init__()
-        self.dimension_generator('TravelAllowancePolicy', ['vehicle type', 'travelallowanceRate'])
+        self.dimension_generator('TravelAllowancePolicy', ['vehicle type', 'travelallowanceRate'], source)
 
 # weather allowance policy dimension table
 class DimWeatherAllowancePolicy(ModelAbstract):
-    def __init__(self):
+    def __init__(self, source):
+        super().__init__()
+        self.dimension_generator('WeatherAllowancePolicy', ['weather', 'temperature', 'weatehr allowance'], source)
+
+# holiday dimension table
+class DimHoliday(ModelAbstract):
+    def __init__(self, source):
         super().__init__()
-        self.dimension_generator('WeatherAllowancePolicy', ['weather', 'temperature', 'weatehr allowance'])
+        self.dimension_generator('Holiday', ['isholiday'], source)
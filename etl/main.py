@@ -1,127 +1,245 @@
+import sys
+import tracemalloc
+
+from artifacts import ARTIFACT_CONTAINER, ArtifactPublisher, artifact_blob_options, print_artifact_metrics
+from checkpoint import RunManifest, with_retry
 from db import *
 from dim import *
+from physical import apply_physical_design, print_physical_design_metrics
+from publish import prepare_staging, publish, rollback
+from transform import (
+    TRANSFORM_PARTITION_ROWS, TRANSFORM_WORKERS, build_pay_sketch, normalise_source, parallel_transform,
+    quality_counts, transform_rows,
+)
+
+
+# rows per fact table upload, each one checkpointed separately
+LOAD_PARTITION_ROWS = int(os.environ.get('ETL_LOAD_PARTITION_ROWS') or 500_000)
+
+# where rows failing the data-quality gate are written, and the share of source rows
+# that may fail before the run is stopped instead of loading a mostly broken extract
+QUARANTINE_PATH = os.environ.get('ETL_QUARANTINE_PATH') or './data/quarantine.parquet'
+QUARANTINE_MAX_RATIO = float(os.environ.get('ETL_QUARANTINE_MAX_RATIO') or 0.05)
 
 
 class MainETL():
     # list of columns need to be replaced
-    def __init__(self) -> None:
+    def __init__(self, workers=TRANSFORM_WORKERS) -> None:
+        self.workers = workers
         self.drop_columns = []
         self.dimension_tables = []
+        self.metrics = {}
+        self.manifest = None
+        self.pay_sketch = None
+        self.quarantine = None
 
     # Step 1: Extract data from source
-    def extract(self, csv_file="ETL_Example_Data.csv"):
+    def extract(self, csv_file=blob_name):
         print(f'Step 1: Extracting data from csv file')
-        self.fact_table = df
+        # checkpoints are only valid for the exact source blob they were built from
+        self.manifest = RunManifest(source_id=get_database().blob_etag(csv_file))
+        if self.manifest.done('extract'):
+            print('Resuming from extract checkpoint')
+            self.fact_table = self.manifest.load_frame('extract')
+        else:
+            self.fact_table = read_source(csv_file)
+            # row groups double as the partitions of the parallel transform
+            self.manifest.save_frame('extract', self.fact_table, row_group_size=TRANSFORM_PARTITION_ROWS)
         print(f'We find {len(self.fact_table.index)} rows and {len(self.fact_table.columns)} columns in csv file: {csv_file}')
         print(f'Step 1 finished')
 
     # Step 2: Transform data to fit the star schema model
     def transform(self):
-        # transform data types
-        self.fact_table[['travelallowanceRate']] = self.fact_table[['travelallowanceRate']].astype(float)
-        int_cols = ['travel distance', 'weatehr allowance', 'work hours', 'job hourly']
-        self.fact_table[int_cols] = self.fact_table[int_cols].astype(int)
-        self.fact_table[['weather', 'temperature']] = self.fact_table[['weather', 'temperature']].astype(str)
+        if self.resume_transform():
+            print(f'Step 2 finished (resumed from checkpoint)')
+            return
+
+        # track peak memory of numpy/pandas allocations made during the transform
+        tracemalloc.start()
+
+        # normalise weather categories and parse dates before the dimensions are built
+        fact = normalise_source(self.fact_table)
 
         # fetch staff dimension table
-        dim_staff = DimStaff()
+        dim_staff = DimStaff(fact)
         self.drop_columns += dim_staff.columns
         self.dimension_tables.append(dim_staff)
 
-        # fetch date dimension table
-        dim_date = DimDate()
+        # build the calendar dimension over the range of the parsed source dates
+        dim_date = DimDate(fact['date'])
         self.drop_columns += dim_date.columns
-        new_dim =  dim_date.dimension_table[['date']]
-
-        # convert the date column to datetime format
-        new_dim['date'] = pd.to_datetime(new_dim['date'], format='%d/%m/%Y')
-        self.fact_table['date'] = pd.to_datetime(self.fact_table['date'], format='%d/%m/%Y')
-
-        # extract the month number and convert it to month name
-        new_dim['date'] = new_dim['date'].dt.month_name()
-        self.fact_table['date'] = self.fact_table['date'].dt.month_name()
-        new_dim = new_dim.drop_duplicates()
-
-        # modify primary key for date dimension table
-        new_dim[f'Date_id'] = range(1, len(new_dim) + 1)
-        dim_date.dimension_table = new_dim
         self.dimension_tables.append(dim_date)
 
         # fetch maintenance job dimension table
-        dim_job = DimMaintenanceJob()
+        dim_job = DimMaintenanceJob(fact)
         self.drop_columns += dim_job.columns
         self.dimension_tables.append(dim_job)
 
         # fetch department dimension table
-        dim_department = DimDepartment()
+        dim_department = DimDepartment(fact)
         self.drop_columns += dim_department.columns
         self.dimension_tables.append(dim_department)
 
         # fetch travel dimension table
-        dim_travel_allowance = DimTravelAllowancePolicy()
+        dim_travel_allowance = DimTravelAllowancePolicy(fact)
         self.drop_columns += dim_travel_allowance.columns
         self.dimension_tables.append(dim_travel_allowance)
 
         # fetch weather dimension table
-        dim_weather_allowance = DimWeatherAllowancePolicy()
+        dim_weather_allowance = DimWeatherAllowancePolicy(fact)
         self.drop_columns += dim_weather_allowance.columns
-
-        new_weather = dim_weather_allowance.dimension_table[['weather', 'temperature', 'weatehr allowance']]
-        new_weather.loc[new_weather['weather'] == "heavy rain", 'weather'] = "rain"
-        self.fact_table.loc[self.fact_table['weather'] == "heavy rain", 'weather'] = "rain"
-
-        new_weather = new_weather.drop_duplicates()
-
-        # Create new foreign key column
-        new_weather['WeatherAllowancePolicy_id'] = range(1, len(new_weather) + 1)
-        dim_weather_allowance.dimension_table = new_weather
         self.dimension_tables.append(dim_weather_allowance)
 
         # fetch holiday dimension table
-        dim_holiday = ModelAbstract()
-        dim_holiday.dimension_generator('Holiday', ['isholiday'])
+        dim_holiday = DimHoliday(fact)
         self.drop_columns += dim_holiday.columns
         self.dimension_tables.append(dim_holiday)
 
-        # get Travel Allowance amount
-        travel_allowance_amount = self.fact_table['travel distance'] * self.fact_table['travelallowanceRate']
-        self.fact_table['travel allowance amount'] = travel_allowance_amount
-
-        # get Weather Allowance Amount
-        weather_allowance_amount = self.fact_table['weatehr allowance']
-        self.fact_table['weather allowance amount'] = weather_allowance_amount
-
-        # get Hourly Work Payment
-        work_payment = self.fact_table['work hours'] * self.fact_table['job hourly']
-        self.fact_table['work payment'] = work_payment
-
-        # get Total Payment
-        self.fact_table['total pay this job'] = work_payment + travel_allowance_amount + weather_allowance_amount
-
-        # replace columns in fact table with respective foreign keys
+        # get the payment amounts and replace columns in fact table with respective foreign keys;
+        # in parallel mode every worker does this for a row-range partition of the source
+        key_maps = [dim.key_map() for dim in self.dimension_tables]
+        if self.workers > 1:
+            print(f'Transforming in parallel with {self.workers} workers')
+            self.fact_table, self.pay_sketch, self.quarantine, worker_peak = parallel_transform(
+                self.manifest.frame_path('extract'), key_maps, self.drop_columns, self.workers,
+            )
+            self.metrics['transform_worker_peak_mb'] = round(worker_peak / 2**20, 1)
+        else:
+            self.fact_table, self.quarantine = transform_rows(fact, key_maps, self.drop_columns)
+            self.pay_sketch = build_pay_sketch(self.fact_table)
+
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        self.metrics['transform_peak_mb'] = round(peak / 2**20, 1)
+        if self.workers > 1:
+            # tracemalloc only traces this process, so the workers report their own peaks
+            print(f"Peak memory during transform: {self.metrics['transform_peak_mb']} MB in the parent, "
+                  f"up to {self.metrics['transform_worker_peak_mb']} MB per partition in each of {self.workers} workers")
+        else:
+            print(f"Peak memory during transform: {self.metrics['transform_peak_mb']} MB")
+
+        self.check_quality(quality_counts(self.quarantine, key_maps))
+
+        # checkpoint each dimension table and then the keyed fact table
         for dim in self.dimension_tables:
-            self.fact_table = pd.merge(self.fact_table, dim.dimension_table, on=dim.columns, how='left')
-        self.fact_table = self.fact_table.drop(columns=self.drop_columns)
+            self.manifest.save_frame(f'dim_{dim.name}', dim.dimension_table, columns=dim.columns)
+        self.manifest.save_frame('sketch', self.pay_sketch)
+        self.manifest.save_frame('quarantine', self.quarantine, counts=self.metrics['quality'])
+        self.manifest.save_frame('fact', self.fact_table, dimensions=[dim.name for dim in self.dimension_tables])
 
         print(f'Step 2 finished')
 
-    # Step 3: Load data into Azure SQL Database
+    # restore the dimension and fact tables if the whole transform was checkpointed
+    def resume_transform(self):
+        if not self.manifest.done('fact'):
+            return False
+        names = self.manifest.info('fact')['dimensions']
+        stages = [f'dim_{name}' for name in names] + ['sketch', 'quarantine']
+        if not all(self.manifest.done(stage) for stage in stages):
+            return False
+
+        for name in names:
+            dim = ModelAbstract()
+            dim.restore(name, self.manifest.info(f'dim_{name}')['columns'], self.manifest.load_frame(f'dim_{name}'))
+            self.dimension_tables.append(dim)
+        self.fact_table = self.manifest.load_frame('fact')
+        self.pay_sketch = self.manifest.load_frame('sketch')
+        self.quarantine = self.manifest.load_frame('quarantine')
+        self.metrics['quality'] = self.manifest.info('quarantine')['counts']
+        return True
+
+    # write the quarantined rows, report the per-rule counts and stop the run
+    # if more than QUARANTINE_MAX_RATIO of the source rows failed
+    def check_quality(self, counts):
+        self.metrics['quality'] = counts
+        self.quarantine.to_parquet(QUARANTINE_PATH, index=False)
+        print('Data-quality gate:')
+        for rule, count in counts.items():
+            print(f'\t{rule:<35} {count:>10,}')
+
+        total = len(self.fact_table) + len(self.quarantine)
+        if len(self.quarantine) > QUARANTINE_MAX_RATIO * total:
+            raise RuntimeError(
+                f'{len(self.quarantine):,} of {total:,} rows failed the data-quality gate '
+                f'(more than {QUARANTINE_MAX_RATIO:.0%}), see {QUARANTINE_PATH}'
+            )
+
+    # Step 3: Load data into the staging schema, then publish it in one swap.
+    # Every database step is retried on transient errors and recorded in the
+    # manifest, so a rerun continues with the first step (or fact partition) not done.
     def load(self):
+        m = self.manifest
+        if not m.done('stage_prepared'):
+            with_retry(prepare_staging)
+            m.mark('stage_prepared', partition_rows=LOAD_PARTITION_ROWS)
+        partition_rows = m.info('stage_prepared')['partition_rows']
+
         # Load dimension tables first
         for table in self.dimension_tables:
-            table.load()
+            if not m.done(f'load_dim_{table.name}'):
+                with_retry(table.load, schema=STAGE_SCHEMA)
+                m.mark(f'load_dim_{table.name}', rows=len(table.dimension_table))
+
+        # Load fact table partition by partition
+        self.fact_table['Total_Pay_Fact_id'] = range(1, len(self.fact_table) + 1)
+        for start in range(0, len(self.fact_table), partition_rows):
+            stage = f'load_fact_{start // partition_rows}'
+            if not m.done(stage):
+                partition = self.fact_table.iloc[start:start + partition_rows]
+                with_retry(self.load_fact_partition, partition, first=start == 0)
+                m.mark(stage, rows=len(partition))
+
+        self.fact_table.to_csv('./data/Total_Pay_Fact.csv')
+
+        # Load the pay quantile sketches next to the fact table
+        self.pay_sketch['Pay_Sketch_Fact_id'] = range(1, len(self.pay_sketch) + 1)
+        if not m.done('load_sketch'):
+            with_retry(get_database().upload_dataframe_sqldatabase, 'Pay_Sketch_Fact', blob_data=self.pay_sketch, schema=STAGE_SCHEMA)
+            m.mark('load_sketch', rows=len(self.pay_sketch))
+
+        self.pay_sketch.to_csv('./data/Pay_Sketch_Fact.csv')
+
+        # Create foreign key constraints
+        if not m.done('fact_constraints'):
+            with_retry(self.add_fact_constraints)
+            m.mark('fact_constraints')
+
+        # Build FK/covering indexes and refresh statistics before the tables go live
+        if not m.done('physical_design'):
+            print('Applying physical design:')
+            self.metrics['physical_design'] = with_retry(apply_physical_design, engine, STAGE_SCHEMA)
+            print_physical_design_metrics(self.metrics['physical_design'])
+            m.mark('physical_design', steps=len(self.metrics['physical_design']))
+
+        # Swap the staged star schema in; readers only ever see a complete version
+        if not m.done('publish'):
+            self.metrics['publish_seconds'] = with_retry(publish)
+            m.mark('publish')
+
+        print(f'Step 3 finished')
 
-        # Load fact table and create foreign key constraints
+    # upload one fact partition into the staging table; the first one creates the table,
+    # later ones first remove any rows of their id range left by an interrupted attempt
+    def load_fact_partition(self, partition, first=False):
+        if first:
+            get_database().upload_dataframe_sqldatabase('Total_Pay_Fact', blob_data=partition, schema=STAGE_SCHEMA)
+            return
+        ids = partition['Total_Pay_Fact_id']
         with engine.connect() as con:
             trans = con.begin()
-            self.fact_table['Total_Pay_Fact_id'] = range(1, len(self.fact_table) + 1)
-            database.upload_dataframe_sqldatabase(f'Total_Pay_Fact', blob_data=self.fact_table)
-
-            self.fact_table.to_csv('./data/Total_Pay_Fact.csv')
+            con.execute(
+                text(f'DELETE FROM {sql_table("Total_Pay_Fact", STAGE_SCHEMA)} WHERE [Total_Pay_Fact_id] BETWEEN :lo AND :hi'),
+                {'lo': int(ids.iloc[0]), 'hi': int(ids.iloc[-1])},
+            )
+            trans.commit()
+        get_database().append_dataframe_sqldatabase('Total_Pay_Fact', blob_data=partition, schema=STAGE_SCHEMA)
 
-            fact_qt = sql_table('Total_Pay_Fact')
+    def add_fact_constraints(self):
+        with engine.connect() as con:
+            trans = con.begin()
+            fact_qt = sql_table('Total_Pay_Fact', STAGE_SCHEMA)
             for table in self.dimension_tables:
-                dim_qt = sql_table(f'{table.name}_dim')
+                dim_qt = sql_table(f'{table.name}_dim', STAGE_SCHEMA)
                 con.execute(text(
                     f'ALTER TABLE {fact_qt} WITH NOCHECK ADD CONSTRAINT [FK_{table.name}_dim] '
                     f'FOREIGN KEY ([{table.name}_id]) REFERENCES {dim_qt} ([{table.name}_id]) '
@@ -129,7 +247,25 @@ class MainETL():
                 ))
             trans.commit()
 
-        print(f'Step 3 finished')
+    # Step 4: Archive the run outputs (the ./data csv files) to blob storage
+    def archive(self):
+        if self.manifest.done('archive'):
+            return
+        storage = AzureDB(blob_options=artifact_blob_options())
+        storage.access_container(ARTIFACT_CONTAINER)
+
+        publisher = ArtifactPublisher(storage.container_client)
+        for table in self.dimension_tables:
+            publisher.add_frame(f'{table.name}_dim.csv', table.dimension_table)
+        publisher.add_frame('Total_Pay_Fact.csv', self.fact_table)
+        publisher.add_frame('Pay_Sketch_Fact.csv', self.pay_sketch)
+        publisher.add_bytes(os.path.basename(QUARANTINE_PATH), self.quarantine.to_parquet(index=False))
+
+        print('Archiving run outputs:')
+        self.metrics['artifacts'] = publisher.publish()
+        print_artifact_metrics(self.metrics['artifacts'])
+        self.manifest.mark('archive')
+        print(f'Step 4 finished')
 
     # main loop to run the ETL process
     def mainLoop(self):
@@ -138,13 +274,19 @@ class MainETL():
         # Step 2
         self.transform()
         # Step 3
-        try:
-            database.delete_sqldatabase('Total_Pay_Fact')
-            self.load()
-        except:
-            self.load()
+        self.load()
+        # Step 4
+        self.archive()
+
+        # the run is published, so the next run starts from a fresh download
+        self.manifest.clear()
 
 def main():
+    # `python main.py rollback` restores the previously published star schema
+    if len(sys.argv) > 1 and sys.argv[1] == 'rollback':
+        rollback()
+        return
+
     # create an instance of MainETL
     main = MainETL()
     main.mainLoop()
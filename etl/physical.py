@@ -0,0 +1,176 @@
+import os
+import sys
+import time
+
+from sqlalchemy import text
+
+# build a clustered columnstore on the fact table (SQL Server only)
+FACT_COLUMNSTORE = (os.environ.get('SQL_COLUMNSTORE') or '').strip().lower() in ('1', 'true', 'yes')
+
+FACT_MEASURES = [
+    'work hours', 'travel distance', 'job hourly', 'work payment',
+    'travel allowance amount', 'weather allowance amount', 'total pay this job',
+]
+
+FACT_FOREIGN_KEYS = [
+    'Staff_id', 'Date_id', 'Department_id', 'MaintenanceJob_id',
+    'TravelAllowancePolicy_id', 'WeatherAllowancePolicy_id', 'Holiday_id',
+]
+
+# declarative physical design applied after each load
+#   indexes: name -> key columns plus optional covering (INCLUDE) columns
+#   columnstore: replace the clustered PK with a clustered columnstore (SQL Server)
+#   statistics: refresh optimizer statistics once the indexes exist
+PHYSICAL_DESIGN = {
+    'Total_Pay_Fact': {
+        'indexes': {
+            # date range filter of load_fact_joined, covering every join key and measure
+            'IX_Total_Pay_Fact_Date_covering': {
+                'keys': ['Date_id'],
+                'include': [c for c in FACT_FOREIGN_KEYS if c != 'Date_id'] + FACT_MEASURES,
+            },
+            # one index per remaining foreign key for the dimension joins
+            **{
+                f'IX_Total_Pay_Fact_{fk}': {'keys': [fk]}
+                for fk in FACT_FOREIGN_KEYS if fk != 'Date_id'
+            },
+        },
+        'columnstore': FACT_COLUMNSTORE,
+        'statistics': True,
+    },
+    # percentile charts read every sketch row of the selected months; measure is a
+    # text column (varchar(max) on SQL Server), which can be covered but not a key
+    'Pay_Sketch_Fact': {
+        'indexes': {
+            'IX_Pay_Sketch_Fact_month': {'keys': ['month_key'], 'include': ['measure']},
+        },
+        'statistics': True,
+    },
+    'Date_dim': {
+        'indexes': {
+            'IX_Date_dim_year_month': {'keys': ['year', 'month'], 'include': ['month_name']},
+        },
+        'statistics': True,
+    },
+    'Staff_dim': {'statistics': True},
+    'Department_dim': {'statistics': True},
+    'MaintenanceJob_dim': {'statistics': True},
+    'TravelAllowancePolicy_dim': {'statistics': True},
+    'WeatherAllowancePolicy_dim': {'statistics': True},
+    'Holiday_dim': {'statistics': True},
+}
+
+
+# quote an identifier for the target backend
+def quote(dialect, name):
+    if dialect == 'mssql':
+        return f'[{name}]'
+    return '"' + name.replace('"', '""') + '"'
+
+
+# quote a (schema-qualified) table name for the target backend
+def qualified_table(dialect, schema, table):
+    if schema:
+        return f'{quote(dialect, schema)}.{quote(dialect, table)}'
+    return quote(dialect, table)
+
+
+# DDL for a single (optionally covering) nonclustered index
+def index_ddl(dialect, schema, table, name, keys, include=None):
+    qt = qualified_table(dialect, schema, table)
+    key_cols = ', '.join(quote(dialect, c) for c in keys)
+    if dialect == 'mssql':
+        ddl = f'CREATE NONCLUSTERED INDEX {quote(dialect, name)} ON {qt} ({key_cols})'
+        if include:
+            ddl += ' INCLUDE (' + ', '.join(quote(dialect, c) for c in include) + ')'
+        return (
+            f"IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = '{name}' "
+            f"AND object_id = OBJECT_ID('{qt}')) {ddl};"
+        )
+
+    # SQLite/DuckDB have no INCLUDE clause, so covering columns become trailing keys
+    if include:
+        key_cols += ', ' + ', '.join(quote(dialect, c) for c in include)
+    if schema and dialect == 'sqlite':
+        return (
+            f'CREATE INDEX IF NOT EXISTS {quote(dialect, schema)}.{quote(dialect, name)} '
+            f'ON {quote(dialect, table)} ({key_cols});'
+        )
+    return f'CREATE INDEX IF NOT EXISTS {quote(dialect, name)} ON {qt} ({key_cols});'
+
+
+# DDL to swap the clustered rowstore PK for a clustered columnstore
+def columnstore_ddl(dialect, schema, table):
+    if dialect != 'mssql':
+        return []
+    qt = qualified_table(dialect, schema, table)
+    return [
+        f'ALTER TABLE {qt} DROP CONSTRAINT [PK_{table}];',
+        f'CREATE CLUSTERED COLUMNSTORE INDEX [CCI_{table}] ON {qt};',
+        f'ALTER TABLE {qt} ADD CONSTRAINT [PK_{table}] PRIMARY KEY NONCLUSTERED ([{table}_id] ASC);',
+    ]
+
+
+# DDL to refresh optimizer statistics
+def statistics_ddl(dialect, schema, table):
+    if dialect == 'mssql':
+        return f'UPDATE STATISTICS {qualified_table(dialect, schema, table)};'
+    return f'ANALYZE {qualified_table(dialect, schema, table)};'
+
+
+# ordered (kind, table, name, sql) steps for the whole design
+def physical_design_steps(dialect, schema=None, design=PHYSICAL_DESIGN):
+    steps = []
+    for table, spec in design.items():
+        if spec.get('columnstore'):
+            for ddl in columnstore_ddl(dialect, schema, table):
+                steps.append(('columnstore', table, f'CCI_{table}', ddl))
+        for name, index in spec.get('indexes', {}).items():
+            ddl = index_ddl(dialect, schema, table, name, index['keys'], index.get('include'))
+            steps.append(('index', table, name, ddl))
+    # statistics last, so they also cover the new indexes
+    for table, spec in design.items():
+        if spec.get('statistics'):
+            steps.append(('statistics', table, table, statistics_ddl(dialect, schema, table)))
+    return steps
+
+
+# apply the physical design and return one metrics record per step
+def apply_physical_design(engine, schema=None, design=PHYSICAL_DESIGN):
+    dialect = engine.dialect.name
+    metrics = []
+    with engine.connect() as con:
+        trans = con.begin()
+        for kind, table, name, ddl in physical_design_steps(dialect, schema, design):
+            start = time.perf_counter()
+            con.execute(text(ddl))
+            metrics.append({
+                'kind': kind,
+                'table': table,
+                'name': name,
+                'seconds': round(time.perf_counter() - start, 3),
+            })
+        trans.commit()
+    return metrics
+
+
+def print_physical_design_metrics(metrics):
+    for m in metrics:
+        print(f"\t{m['kind']:<12} {m['table']:<28} {m['name']:<45} {m['seconds']:.3f}s")
+
+
+# verify the design against a local stand-in built from the ./data/*.csv load outputs
+# usage: python physical.py sqlite:///:memory: [./data]
+if __name__ == '__main__':
+    import pandas as pd
+    from sqlalchemy import create_engine
+
+    url = sys.argv[1] if len(sys.argv) > 1 else 'sqlite:///:memory:'
+    data_dir = sys.argv[2] if len(sys.argv) > 2 else './data'
+    local = create_engine(url)
+    for table in PHYSICAL_DESIGN:
+        pd.read_csv(os.path.join(data_dir, f'{table}.csv'), index_col=0).to_sql(
+            table, local, if_exists='replace', index=False,
+        )
+    print(f'Applying physical design on {local.dialect.name}')
+    print_physical_design_metrics(apply_physical_design(local))
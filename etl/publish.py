@@ -0,0 +1,85 @@
+import time
+
+from sqlalchemy import text
+
+from db import BACKUP_SCHEMA, STAGE_SCHEMA, TARGET_SCHEMA, engine, sql_table
+
+# Star-schema versions live in three schemas:
+#   STAGE_SCHEMA  - the next version, loaded, constrained and indexed while readers use the target
+#   TARGET_SCHEMA - the published version the dashboard reads
+#   BACKUP_SCHEMA - the previous published version, kept for rollback
+# Publishing moves target -> backup and stage -> target with ALTER SCHEMA ... TRANSFER
+# in one transaction; only metadata changes, so readers see either the old or the new
+# star schema and never a partially loaded table.
+#
+# Tables are always handled fact first, so foreign keys never block a drop.
+STAR_TABLES = [
+    'Total_Pay_Fact', 'Pay_Sketch_Fact',
+    'Staff_dim', 'Date_dim', 'MaintenanceJob_dim', 'Department_dim',
+    'TravelAllowancePolicy_dim', 'WeatherAllowancePolicy_dim', 'Holiday_dim',
+]
+
+
+# create a schema if it does not exist
+def ensure_schema(con, schema):
+    con.execute(text(f"IF SCHEMA_ID(N'{schema}') IS NULL EXEC('CREATE SCHEMA [{schema}]');"))
+
+
+# drop tables from a schema if they exist
+def drop_tables(con, schema, tables):
+    for table in tables:
+        qt = sql_table(table, schema)
+        con.execute(text(f"IF OBJECT_ID(N'{qt}', N'U') IS NOT NULL DROP TABLE {qt};"))
+
+
+# move tables from one schema to another, skipping the ones that do not exist
+def transfer_tables(con, source, destination, tables):
+    for table in tables:
+        qt = sql_table(table, source)
+        con.execute(text(
+            f"IF OBJECT_ID(N'{qt}', N'U') IS NOT NULL ALTER SCHEMA [{destination}] TRANSFER {qt};"
+        ))
+
+
+# create the stage/backup schemas and clear tables left over from an earlier staged load
+def prepare_staging(tables=STAR_TABLES):
+    with engine.connect() as con:
+        trans = con.begin()
+        ensure_schema(con, STAGE_SCHEMA)
+        ensure_schema(con, BACKUP_SCHEMA)
+        drop_tables(con, STAGE_SCHEMA, tables)
+        trans.commit()
+
+
+# atomically publish the staged tables, keeping the current version as the backup
+def publish(tables=STAR_TABLES):
+    print(f'Publishing {STAGE_SCHEMA} -> {TARGET_SCHEMA} (previous version kept in {BACKUP_SCHEMA})')
+    start = time.perf_counter()
+    with engine.connect() as con:
+        trans = con.begin()
+        con.execute(text('SET XACT_ABORT ON;'))
+        drop_tables(con, BACKUP_SCHEMA, tables)
+        transfer_tables(con, TARGET_SCHEMA, BACKUP_SCHEMA, tables)
+        transfer_tables(con, STAGE_SCHEMA, TARGET_SCHEMA, tables)
+        trans.commit()
+    return round(time.perf_counter() - start, 3)
+
+
+# swap the backup version back into the target; the rolled back version moves to stage
+def rollback(tables=STAR_TABLES):
+    print(f'Rolling back {TARGET_SCHEMA} to the version in {BACKUP_SCHEMA}')
+    with engine.connect() as con:
+        trans = con.begin()
+        missing = [
+            table for table in tables
+            if con.execute(text(f"SELECT OBJECT_ID(N'{sql_table(table, BACKUP_SCHEMA)}', N'U')")).scalar() is None
+        ]
+        if missing:
+            trans.rollback()
+            raise RuntimeError(f'No complete backup to roll back to, missing: {", ".join(missing)}')
+
+        con.execute(text('SET XACT_ABORT ON;'))
+        drop_tables(con, STAGE_SCHEMA, tables)
+        transfer_tables(con, TARGET_SCHEMA, STAGE_SCHEMA, tables)
+        transfer_tables(con, BACKUP_SCHEMA, TARGET_SCHEMA, tables)
+        trans.commit()
@@ -0,0 +1,322 @@
+# Row-level transformation helpers shared by the serial and the parallel transform.
+# Workers only need this module, so it does not import db/dim. Under the spawn and
+# forkserver start methods workers also re-import main.py (and so db/dim); that is
+# safe because dim only connects to Azure Storage on first use (see get_database).
+import os
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+# worker processes for the transform (1 = serial) and source rows per partition
+TRANSFORM_WORKERS = int(os.environ.get('ETL_TRANSFORM_WORKERS') or 1)
+TRANSFORM_PARTITION_ROWS = int(os.environ.get('ETL_TRANSFORM_PARTITION_ROWS') or 1_000_000)
+
+# relative accuracy of the pay quantile sketches, grain they are kept at and measures sketched
+SKETCH_RELATIVE_ACCURACY = float(os.environ.get('ETL_SKETCH_RELATIVE_ACCURACY') or 0.01)
+SKETCH_GRAIN = ['month_key', 'Department_id', 'MaintenanceJob_id', 'TravelAllowancePolicy_id', 'WeatherAllowancePolicy_id']
+SKETCH_MEASURES = ['total pay this job', 'travel allowance amount', 'weather allowance amount']
+# fact rows sketched at a time; chunk sketches merge like partition sketches
+SKETCH_CHUNK_ROWS = 65_536
+
+
+# positions of a column's values within a small index of unique values (-1 if absent);
+# categorical columns are resolved on their categories and gathered through the codes
+def value_positions(values, uniques):
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        # trailing entry serves code -1, so missing values match a missing dimension value like merge does
+        lookup = np.append(
+            uniques.get_indexer(values.cat.categories.to_numpy()), uniques.get_indexer([np.nan]),
+        ).astype('int32')
+        return lookup[values.cat.codes.to_numpy()]
+    return uniques.get_indexer(values.to_numpy()).astype('int32')
+
+# compact integer code per row over the given columns, equal codes meaning equal rows;
+# categorical columns contribute their codes directly instead of being hashed
+def row_codes(frame, columns):
+    code = np.zeros(len(frame), dtype='int64')
+    for i, col in enumerate(columns):
+        values = frame[col]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            col_codes, size = values.cat.codes.to_numpy() + 1, len(values.cat.categories) + 1
+        else:
+            col_codes, uniques = pd.factorize(values, use_na_sentinel=False)
+            size = len(uniques)
+        code = code * size + col_codes
+        # renumber between columns so the combined code cannot overflow
+        if i < len(columns) - 1:
+            code, _ = pd.factorize(code)
+    return code
+
+# integer yyyymmdd surrogate key for a datetime series without missing dates;
+# 64-bit like the dimension primary keys, which upload_dataframe_sqldatabase makes bigint
+def date_key(dates):
+    return (dates.dt.year * 10000 + dates.dt.month * 100 + dates.dt.day).astype('int64')
+
+# a dimension's key for every fact row without a full-width merge copy: the natural
+# key columns are folded one at a time into a compact integer code for both tables,
+# and each fact code is looked up among the dimension's codes. Returns the keys as
+# int32 and the rows without a dimension row, whose key is undefined.
+def dimension_keys(fact, name, columns, dim):
+    fact_code = dim_code = None
+    missing = np.zeros(len(fact), dtype=bool)
+    for col in columns:
+        uniques = pd.Index(dim[col].drop_duplicates().to_numpy())
+        fact_pos = value_positions(fact[col], uniques)
+        dim_pos = value_positions(dim[col], uniques)
+        missing |= fact_pos < 0
+        if fact_code is None:
+            fact_code, dim_code = fact_pos, dim_pos
+            continue
+
+        # renumber the combined codes so they never grow beyond the dimension size
+        dim_code, seen = pd.factorize(dim_code.astype('int64') * len(uniques) + dim_pos)
+        fact_code = pd.Index(seen).get_indexer(fact_code.astype('int64') * len(uniques) + fact_pos)
+        missing |= fact_code < 0
+
+    # dimension rows are unique, so their final codes are a permutation of 0..n-1
+    ids = np.empty(len(dim), dtype='int32')
+    ids[dim_code] = dim[f'{name}_id'].to_numpy()
+    return ids[fact_code], missing
+
+# merge categories of a categorical column through its codes, without materialising the values
+def collapse_categories(values, mapping):
+    renamed = values.cat.categories.map(lambda c: mapping.get(c, c))
+    codes, categories = pd.factorize(renamed)
+    codes = np.append(codes, -1)[values.cat.codes.to_numpy()]
+    return pd.Series(pd.Categorical.from_codes(codes, categories=categories), index=values.index, name=values.name)
+
+# parse each distinct date string once and gather the results through the category codes;
+# dates not in the format become NaT
+def parse_category_dates(values, format):
+    parsed = pd.to_datetime(values.cat.categories, format=format, errors='coerce')
+    dates = parsed.take(values.cat.codes.to_numpy(), allow_fill=True, fill_value=pd.NaT)
+    return pd.Series(dates, index=values.index, name=values.name)
+
+# parse each distinct value once as a whole number >= 0 and gather the results through
+# the category codes; anything else becomes <NA>
+def parse_category_integers(values, dtype='int16'):
+    numbers = pd.to_numeric(values.cat.categories.to_series(), errors='coerce').to_numpy(dtype='float64')
+    valid = (numbers == np.floor(numbers)) & (numbers >= 0) & (numbers <= np.iinfo(dtype).max)
+    lookup = np.append(np.where(valid, numbers, 0), 0).astype(dtype)
+    codes = values.cat.codes.to_numpy()
+    parsed = pd.arrays.IntegerArray(lookup[codes], ~np.append(valid, False)[codes])
+    return pd.Series(parsed, index=values.index, name=values.name)
+
+# source columns rewritten by normalise_source; their source values are kept alongside
+# (see source_column) so quarantined rows show what was actually received
+NORMALISED_COLUMNS = ['weather', 'date', 'work hours']
+
+def source_column(col):
+    return f'{col} (source)'
+
+# numeric source columns the fact measures are read from; read nullable, blank ones
+# are quarantined (see quality_rules)
+SOURCE_MEASURES = ['travel distance', 'travelallowanceRate', 'weatehr allowance', 'job hourly', 'work payment $']
+
+# dtypes are already planned at parse time (see SOURCE_DTYPES), so only the weather
+# categories, dates and work hours need normalising before dimensions/keys are built
+def normalise_source(fact):
+    for col in NORMALISED_COLUMNS:
+        fact[source_column(col)] = fact[col]
+    fact['weather'] = collapse_categories(fact['weather'], {'heavy rain': 'rain'})
+    fact['date'] = parse_category_dates(fact['date'], format='%d/%m/%Y')
+    fact['work hours'] = parse_category_integers(fact['work hours'])
+    return fact
+
+# compute all derived pay measures in one vectorised pass over the source arrays
+def derive_measures(fact):
+    # missing values count as 0 here; those rows are quarantined by transform_rows
+    travel = np.multiply(fact['travel distance'].to_numpy(dtype='int32', na_value=0), fact['travelallowanceRate'].to_numpy())
+    weather = fact['weatehr allowance'].to_numpy(dtype='int16', na_value=0)
+    hours = fact['work hours'].to_numpy(dtype='int16', na_value=0)
+    work = np.multiply(hours, fact['job hourly'].to_numpy(dtype='int16', na_value=0), dtype='int32')
+
+    # accumulate the total in place instead of through intermediate Series
+    total = np.add(work, travel)
+    total += weather
+
+    fact['travel allowance amount'] = travel
+    fact['weather allowance amount'] = weather
+    fact['work payment'] = work
+    fact['total pay this job'] = total
+    return fact
+
+# Data-quality gate. Rather than failing the run or loading NULL foreign keys (which
+# WITH NOCHECK constraints never reject), rows failing a rule are split off into a
+# quarantine frame that lists the codes of every rule they failed:
+#   invalid_date        date missing or not in the '%d/%m/%Y' format
+#   invalid_work_hours  work hours missing or not a whole number >= 0
+#   missing_measure     a distance, rate, allowance or payment (SOURCE_MEASURES) is blank
+#   missing_<name>      no row in the <name> dimension for the natural key (NULL foreign key)
+def quality_rules(key_maps):
+    return ['invalid_date', 'invalid_work_hours', 'missing_measure'] + [f'missing_{name}' for name, _, dim in key_maps if dim is not None]
+
+# rows failing any rule as source values, with their source row number and reason codes
+def quarantine_rows(fact, failures, source_columns):
+    failed = np.logical_or.reduce(list(failures.values()))
+    rows = fact.loc[failed]
+    quarantine = pd.DataFrame({'source_row': rows.index.to_numpy()})
+    for col in source_columns:
+        values = rows[source_column(col) if col in NORMALISED_COLUMNS else col]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            values = values.astype('string')
+        # as an array, so nullable measures keep their dtype and blanks show as <NA>
+        quarantine[col] = values.array
+
+    rules = np.array(list(failures))
+    hits = np.column_stack([mask[failed] for mask in failures.values()])
+    quarantine['reasons'] = pd.array([';'.join(rules[row]) for row in hits], dtype='string')
+
+    # text columns as the string dtype even when no row failed, so concatenating the
+    # partitions of a parallel transform gives the same dtypes as the serial pass
+    text = quarantine.select_dtypes(include=['object', 'string']).columns
+    return quarantine.astype(dict.fromkeys(text, 'string')), failed
+
+# rows failing each rule, plus the total quarantined
+def quality_counts(quarantine, key_maps):
+    reasons = quarantine['reasons'].str.split(';').explode().value_counts()
+    counts = {rule: int(reasons.get(rule, 0)) for rule in quality_rules(key_maps)}
+    counts['quarantined'] = len(quarantine)
+    return counts
+
+# derive the measures, replace the natural key columns with foreign keys and apply
+# the data-quality gate in the same pass; key_maps holds (name, columns, dimension
+# table) per dimension, a table of None meaning the key is the yyyymmdd calendar key
+# of the single date column. Returns the keyed fact rows passing every rule and the
+# quarantined rows.
+def transform_rows(fact, key_maps, drop_columns):
+    source_columns = [c for c in fact.columns if c not in map(source_column, NORMALISED_COLUMNS)]
+    failures = {
+        'invalid_date': fact['date'].isna().to_numpy(),
+        'invalid_work_hours': fact['work hours'].isna().to_numpy(),
+        'missing_measure': np.logical_or.reduce([fact[col].isna().to_numpy() for col in SOURCE_MEASURES]),
+    }
+
+    derive_measures(fact)
+    # keys are held as compact int32 until the failed rows are gone
+    keys = {}
+    for name, columns, dim in key_maps:
+        if dim is not None:
+            keys[name], failures[f'missing_{name}'] = dimension_keys(fact, name, columns, dim)
+
+    quarantine, failed = quarantine_rows(fact, failures, source_columns)
+    del failures
+    if len(quarantine):
+        fact = fact.loc[~failed].reset_index(drop=True)
+
+    # the remaining rows passed, so the parsed and measure columns hold no missing values
+    # (and become plain numpy columns without a copy) and every key is defined; keys are
+    # written 64-bit, one column at a time, to match the bigint dimension primary keys they
+    # reference (wrapped in a Series, as assigning an array would copy it once more)
+    for col in ['work hours', *SOURCE_MEASURES]:
+        fact[col] = fact[col].astype(getattr(fact[col].dtype, 'numpy_dtype', fact[col].dtype))
+    for name, columns, dim in key_maps:
+        if dim is None:
+            # the parsed dates are not kept past their key
+            fact[f'{name}_id'] = date_key(fact.pop(columns[0]))
+            continue
+        ids = keys.pop(name)
+        ids = (ids[~failed] if len(quarantine) else ids).astype('int64')
+        fact[f'{name}_id'] = pd.Series(ids, index=fact.index, copy=False)
+    dropped = drop_columns + list(map(source_column, NORMALISED_COLUMNS))
+    return fact.drop(columns=[c for c in dropped if c in fact]), quarantine
+
+
+# Pay quantile sketches (DDSketch-style log buckets).
+# A value v != 0 falls in bucket i = ceil(log_gamma |v|) with gamma = (1 + a) / (1 - a) and is
+# represented by sign(v) * 2 gamma^i / (gamma + 1), which lies within a relative error a of
+# every value in the bucket. A sketch is the count of rows per represented value, so sketches
+# of any row partitions merge exactly by adding counts, and a quantile read from the merged
+# counts is within a relative error a of the exact quantile, no matter how many merges.
+def sketch_values(values, accuracy=SKETCH_RELATIVE_ACCURACY):
+    gamma = (1 + accuracy) / (1 - accuracy)
+    magnitude = np.abs(values)
+    with np.errstate(divide='ignore'):
+        index = np.ceil(np.log(magnitude) / np.log(gamma))
+        represented = np.where(magnitude > 0, 2 * gamma ** index / (gamma + 1), 0.0)
+    return np.sign(values) * represented
+
+# sketch counts of a keyed fact partition, one row per grain, measure and represented value;
+# built one chunk of rows at a time, so the temporaries stay the size of a chunk, and
+# ordered as merged sketches are, so serial and parallel runs give the same table
+def build_pay_sketch(fact):
+    chunks = range(0, max(len(fact), 1), SKETCH_CHUNK_ROWS)
+    return merge_pay_sketches([_sketch_chunk(fact.iloc[start:start + SKETCH_CHUNK_ROWS]) for start in chunks])
+
+# rows are counted on integer codes of the grain and the represented value, and the key
+# columns and measure are only attached to the counted cells
+def _sketch_chunk(fact):
+    keys = {'month_key': fact['Date_id'].to_numpy() // 100, **{c: fact[c].to_numpy() for c in SKETCH_GRAIN[1:]}}
+    month_codes, months = pd.factorize(keys['month_key'])
+    grain, _ = pd.factorize(row_codes(fact, SKETCH_GRAIN[1:]) * len(months) + month_codes)
+    # first row of each grain code, to read the grain's key values back from
+    _, first = np.unique(grain, return_index=True)
+
+    parts = []
+    for measure in SKETCH_MEASURES:
+        value_codes, values = pd.factorize(sketch_values(fact[measure].to_numpy(dtype='float64')), use_na_sentinel=False)
+        cells, counts = np.unique(grain * len(values) + value_codes, return_counts=True)
+        rows = first[cells // len(values)]
+        parts.append(pd.DataFrame({
+            **{c: key[rows] for c, key in keys.items()},
+            'measure': measure,
+            'value': values[cells % len(values)],
+            'count': counts,
+        }))
+    return pd.concat(parts, ignore_index=True)
+
+# merge partition sketches by adding their counts
+def merge_pay_sketches(sketches):
+    return (
+        pd.concat(sketches, ignore_index=True)
+          .groupby(SKETCH_GRAIN + ['measure', 'value'], dropna=False)['count'].sum()
+          .reset_index()
+    )
+
+
+# state each pool worker receives once at start-up
+_worker = {}
+
+def _init_worker(source_path, key_maps, drop_columns):
+    _worker['source'] = pq.ParquetFile(source_path, memory_map=True)
+    _worker['key_maps'] = key_maps
+    _worker['drop_columns'] = drop_columns
+
+# transform one row group of the source file and sketch its pay distribution; also
+# returns the worker's traced peak memory for the partition, which the parent's
+# tracemalloc cannot see
+def _transform_partition(row_group):
+    # already tracing if the worker was forked from a tracing parent
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    tracemalloc.reset_peak()
+
+    source = _worker['source']
+    fact = source.read_row_group(row_group).to_pandas()
+    # number rows as in the whole source, so quarantined rows can be traced back
+    fact.index += sum(source.metadata.row_group(i).num_rows for i in range(row_group))
+    fact, quarantine = transform_rows(normalise_source(fact), _worker['key_maps'], _worker['drop_columns'])
+    sketch = build_pay_sketch(fact)
+
+    peak = tracemalloc.get_traced_memory()[1] - base
+    tracemalloc.stop()
+    return fact, sketch, quarantine, peak
+
+# transform the source Parquet file one row group per task on a process pool; the
+# dimension key maps are sent to each worker once and partitions come back in order.
+# Returns the keyed fact table, the merged pay sketch, the quarantined rows and the
+# largest peak memory a worker traced for one partition.
+def parallel_transform(source_path, key_maps, drop_columns, workers=TRANSFORM_WORKERS):
+    row_groups = range(pq.ParquetFile(source_path).num_row_groups)
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker,
+        initargs=(source_path, key_maps, drop_columns),
+    ) as pool:
+        partitions = list(pool.map(_transform_partition, row_groups))
+    fact = pd.concat([part for part, _, _, _ in partitions], ignore_index=True)
+    quarantine = pd.concat([rows for _, _, rows, _ in partitions], ignore_index=True)
+    sketch = merge_pay_sketches([sketch for _, sketch, _, _ in partitions])
+    return fact, sketch, quarantine, max(peak for _, _, _, peak in partitions)